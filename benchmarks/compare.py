@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+
+# Slowdown ratio above which a measurement counts as a regression
+DEFAULT_THRESHOLD = 0.2
+# Measurements faster than this are too noisy to compare
+DEFAULT_MIN_SECONDS = 0.05
+
+
+def iter_timings(results):
+    """Yield ("shape/stage", seconds) for every timing of a scan_pipeline result."""
+    for shape, result in sorted(results["shapes"].items()):
+        yield f"{shape}/total", result["seconds"]
+        for stage, seconds in sorted(result["stages"].items()):
+            yield f"{shape}/{stage}", seconds
+
+
+def compare_results(
+    baseline, current, threshold=DEFAULT_THRESHOLD, min_seconds=DEFAULT_MIN_SECONDS
+):
+    """
+    Compare the timings of two scan_pipeline result files.
+    :return: List of (name, baseline_seconds, current_seconds, ratio), and the
+    names of the timings slower than baseline by more than threshold
+    """
+    baseline_timings = dict(iter_timings(baseline))
+    rows = []
+    regressions = []
+    for name, seconds in iter_timings(current):
+        base = baseline_timings.get(name)
+        if base is None:
+            continue
+        ratio = seconds / base if base > 0 else float("inf")
+        rows.append((name, base, seconds, ratio))
+        if max(base, seconds) >= min_seconds and ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_comparison(rows, regressions):
+    """Print a comparison table, marking the regressions."""
+    print(f"{'timing':<28}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, base, seconds, ratio in rows:
+        mark = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<28}{base:>12.4f}{seconds:>12.4f}{ratio:>8.2f}{mark}")
+
+
+def main():
+    """Compare two benchmark result files and fail on regressions."""
+    parser = argparse.ArgumentParser(
+        description="Compare two scan_pipeline JSON result files."
+    )
+    parser.add_argument("baseline", help="Results of the reference commit.")
+    parser.add_argument("current", help="Results to check.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed slowdown before a timing is a regression, e.g. 0.2 for 20%%.",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=DEFAULT_MIN_SECONDS,
+        help="Ignore timings below this many seconds in both files.",
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows, regressions = compare_results(
+        baseline, current, args.threshold, args.min_seconds
+    )
+    print_comparison(rows, regressions)
+    if regressions:
+        raise SystemExit(f"{len(regressions)} timings regressed")
+
+
+if __name__ == "__main__":
+    main()
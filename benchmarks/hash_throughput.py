@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from hashing.algorithms import HASH_ALGORITHMS
+from hashing.hash_computer import compute_file_hash
+
+DEFAULT_BUFFER_SIZES = [4096, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+READERS = ["readinto", "mmap"]
+
+
+def create_sample_file(directory, size_mb):
+    """Write a file of random bytes to hash."""
+    file_path = os.path.join(directory, "sample.bin")
+    block = os.urandom(1024 * 1024)
+    with open(file_path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    return file_path
+
+
+def measure_throughput(file_path, algorithm, buffer_size, reader, repeat):
+    """Return the best hashing throughput in MB/s over several runs."""
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    # A threshold of 1 byte maps every file, 0 disables mmap
+    mmap_threshold = 1 if reader == "mmap" else 0
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compute_file_hash(file_path, algorithm, buffer_size, mmap_threshold)
+        best = min(best, time.perf_counter() - start)
+    return size_mb / best
+
+
+def main():
+    """Benchmark every registered digest for each buffer size and reader."""
+    parser = argparse.ArgumentParser(
+        description="Measure file hashing throughput per algorithm, buffer size and reader."
+    )
+    parser.add_argument("--size-mb", type=int, default=256, help="Sample file size.")
+    parser.add_argument(
+        "--algorithms",
+        nargs="+",
+        choices=sorted(HASH_ALGORITHMS),
+        default=sorted(HASH_ALGORITHMS),
+    )
+    parser.add_argument(
+        "--buffer-sizes", nargs="+", type=int, default=DEFAULT_BUFFER_SIZES
+    )
+    parser.add_argument("--readers", nargs="+", choices=READERS, default=READERS)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement.")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = create_sample_file(directory, args.size_mb)
+        print(f"{'algorithm':<14}{'buffer':>12}{'reader':>10}{'MB/s':>12}")
+        for algorithm in args.algorithms:
+            for buffer_size in args.buffer_sizes:
+                for reader in args.readers:
+                    throughput = measure_throughput(
+                        file_path, algorithm, buffer_size, reader, args.repeat
+                    )
+                    results.append(
+                        {
+                            "algorithm": algorithm,
+                            "buffer_size": buffer_size,
+                            "reader": reader,
+                            "mb_per_second": round(throughput, 1),
+                        }
+                    )
+                    print(
+                        f"{algorithm:<14}{buffer_size:>12}{reader:>10}{throughput:>12.1f}"
+                    )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from benchmarks.compare import (
+    DEFAULT_MIN_SECONDS,
+    DEFAULT_THRESHOLD,
+    compare_results,
+    print_comparison,
+)
+from benchmarks.tree_generator import (
+    DEFAULT_MUTATE_FRACTION,
+    RERUN_SHAPES,
+    SHAPES,
+    generate_tree,
+    mutate_tree,
+)
+from db.hash_store import HashStore
+from hashing.hash_computer import HashEngine
+from scanning.scan_manager import scan_directory_and_collect_stats
+
+
+def run_scan(tree, db_file, hash_workers):
+    """Scan a tree into a database, silencing the progress output."""
+    with HashStore(db_file) as hash_store, contextlib.redirect_stdout(io.StringIO()):
+        return scan_directory_and_collect_stats(
+            tree, hash_engine=HashEngine(hash_workers), hash_store=hash_store
+        )
+
+
+def measure_shape(shape, scale, seed, repeat, hash_workers):
+    """
+    Time the scan of a freshly generated tree, or for rerun shapes the second
+    scan after mutate_tree. Each repetition uses a new tree and database.
+    :return: Result of the fastest repetition
+    """
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            tree = os.path.join(workdir, "tree")
+            db_file = os.path.join(workdir, "file_hashes.db")
+            directories, _, total_bytes = generate_tree(tree, shape, scale, seed)
+            changed = None
+            if shape in RERUN_SHAPES:
+                run_scan(tree, db_file, hash_workers)
+                changed = mutate_tree(tree, DEFAULT_MUTATE_FRACTION, seed)
+
+            start = time.perf_counter()
+            metrics, total_files, _, created, updated, changes = run_scan(
+                tree, db_file, hash_workers
+            )
+            seconds = time.perf_counter() - start
+
+        result = {
+            "seconds": round(seconds, 4),
+            "stages": {
+                stage: round(stage_seconds, 4)
+                for stage, stage_seconds in metrics.stage_seconds.items()
+            },
+            "directories": directories,
+            "files": total_files,
+            "generated_bytes": total_bytes,
+            "files_per_second": round(total_files / seconds, 1),
+            "changes": len(changes),
+            "readmes_written": created + updated,
+        }
+        if changed is not None:
+            result["mutated_files"] = changed
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def main():
+    """Time each stage of the scan pipeline on generated trees of every shape."""
+    parser = argparse.ArgumentParser(
+        description="Time the stages of a scan on generated trees."
+    )
+    parser.add_argument(
+        "--shapes", nargs="+", choices=sorted(SHAPES), default=list(SHAPES)
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier of the file counts, or of the file size for huge-files.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per shape.")
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        default=1,
+        help="Hashing workers; 1 hashes inline for steadier timings.",
+    )
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare", help="Results file to compare with, e.g. from the base commit."
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS)
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "hash_workers": args.hash_workers,
+        "shapes": {},
+    }
+    print(f"{'shape':<12}{'files':>8}{'seconds':>10}{'files/s':>12}  stages")
+    for shape in args.shapes:
+        result = measure_shape(
+            shape, args.scale, args.seed, args.repeat, args.hash_workers
+        )
+        results["shapes"][shape] = result
+        stages = " ".join(
+            f"{stage}={seconds:.3f}" for stage, seconds in result["stages"].items()
+        )
+        print(
+            f"{shape:<12}{result['files']:>8}{result['seconds']:>10.3f}"
+            f"{result['files_per_second']:>12.1f}  {stages}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare_results(
+            baseline, results, args.threshold, args.min_seconds
+        )
+        print()
+        print_comparison(rows, regressions)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} timings regressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from scanning.file_scanner import (
+    list_directory,
+    walk_directory,
+    walk_directory_concurrent,
+)
+
+
+def create_sample_tree(directory, depth, fanout, files):
+    """Create a tree with fanout subdirectories per level and files per directory."""
+    count = 0
+    level = [directory]
+    for current_depth in range(depth + 1):
+        next_level = []
+        for dirpath in level:
+            for index in range(files):
+                with open(os.path.join(dirpath, f"file{index}.txt"), "w") as f:
+                    f.write(dirpath)
+            if current_depth < depth:
+                for index in range(fanout):
+                    subdir = os.path.join(dirpath, f"dir{index}")
+                    os.mkdir(subdir)
+                    next_level.append(subdir)
+            count += 1
+        level = next_level
+    return count
+
+
+def with_latency(latency):
+    """Return a list_directory that sleeps first, like a listing over the network."""
+
+    def list_slow_directory(dirpath, skip_name):
+        time.sleep(latency)
+        return list_directory(dirpath, skip_name)
+
+    return list_slow_directory
+
+
+def measure_walk(walk, repeat):
+    """Return the best walk time in seconds and the batches of the last run."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        batches = list(walk())
+        best = min(best, time.perf_counter() - start)
+    return best, batches
+
+
+def main():
+    """Compare the sequential and concurrent walkers under injected listing latency."""
+    parser = argparse.ArgumentParser(
+        description="Measure tree traversal time with a per-directory listing latency."
+    )
+    parser.add_argument("--depth", type=int, default=3, help="Levels below the root.")
+    parser.add_argument(
+        "--fanout", type=int, default=6, help="Subdirectories per directory."
+    )
+    parser.add_argument("--files", type=int, default=10, help="Files per directory.")
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=5.0,
+        help="Delay added to every directory listing.",
+    )
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement.")
+    parser.add_argument("--json", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    list_func = with_latency(args.latency_ms / 1000)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        directories = create_sample_tree(directory, args.depth, args.fanout, args.files)
+        print(f"{directories} directories, {args.latency_ms} ms per listing")
+        print(f"{'workers':>8}{'seconds':>12}{'dirs/s':>12}")
+        expected = None
+        for workers in args.workers:
+
+            def walk():
+                if workers > 1:
+                    return walk_directory_concurrent(
+                        directory, workers=workers, list_func=list_func
+                    )
+                return walk_directory(directory, list_func=list_func)
+
+            seconds, batches = measure_walk(walk, args.repeat)
+            expected = expected or batches
+            if batches != expected:
+                raise SystemExit(f"{workers} workers produced a different walk")
+            results.append(
+                {
+                    "workers": workers,
+                    "seconds": round(seconds, 4),
+                    "directories_per_second": round(directories / seconds, 1),
+                }
+            )
+            print(f"{workers:>8}{seconds:>12.3f}{directories / seconds:>12.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
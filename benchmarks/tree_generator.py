@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import random
+
+# Every generated file and directory gets this mtime (2020-01-01 UTC), so
+# the trees are identical between runs and never racily clean
+FIXED_MTIME_NS = 1577836800 * 10**9
+# Mutated files move one day forward
+MUTATED_MTIME_NS = FIXED_MTIME_NS + 86400 * 10**9
+
+# Tree shapes: depth and fanout of the directory levels, files per
+# directory and their size in bytes, all multiplied by the scale where noted
+SHAPES = {
+    # A long chain of directories with a few files each
+    "deep": {"depth": 60, "fanout": 1, "files": 3, "file_size": 512},
+    # One level of many directories
+    "wide": {"depth": 1, "fanout": 2000, "files": 2, "file_size": 512},
+    # Many tiny files spread over a shallow tree
+    "tiny-files": {"depth": 2, "fanout": 10, "files": 180, "file_size": 64},
+    # A handful of large files
+    "huge-files": {"depth": 0, "fanout": 0, "files": 4, "file_size": 32 * 2**20},
+    # A medium tree scanned again after a small fraction of it changed
+    "rerun": {"depth": 3, "fanout": 6, "files": 20, "file_size": 2048},
+}
+# Shapes measured on a second scan after mutate_tree
+RERUN_SHAPES = {"rerun"}
+# Fraction of the files changed before a rerun
+DEFAULT_MUTATE_FRACTION = 0.01
+
+
+def scaled_shape(shape, scale):
+    """Return the parameters of a shape with its file count or size scaled."""
+    params = dict(SHAPES[shape])
+    if params["file_size"] >= 2**20:
+        params["file_size"] = max(1, int(params["file_size"] * scale))
+    else:
+        params["files"] = max(1, int(params["files"] * scale))
+    return params
+
+
+def set_fixed_times(directory, mtime_ns=FIXED_MTIME_NS):
+    """Give every file and directory of a tree the same mtime, deepest first."""
+    for dirpath, _, filenames in os.walk(directory, topdown=False):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), ns=(mtime_ns, mtime_ns))
+        os.utime(dirpath, ns=(mtime_ns, mtime_ns))
+
+
+def generate_tree(directory, shape, scale=1.0, seed=0):
+    """
+    Create a deterministic tree of the given shape: the same shape, scale and
+    seed always give the same paths, contents and mtimes.
+    :return: (directories, files, total_bytes)
+    """
+    params = scaled_shape(shape, scale)
+    rng = random.Random(f"{shape}:{seed}")
+    directories = files = total_bytes = 0
+    level = [directory]
+    for depth in range(params["depth"] + 1):
+        next_level = []
+        for dirpath in level:
+            os.makedirs(dirpath, exist_ok=True)
+            directories += 1
+            for index in range(params["files"]):
+                with open(os.path.join(dirpath, f"file{index:05d}.bin"), "wb") as f:
+                    f.write(rng.randbytes(params["file_size"]))
+                files += 1
+                total_bytes += params["file_size"]
+            if depth < params["depth"]:
+                next_level += [
+                    os.path.join(dirpath, f"dir{index:04d}")
+                    for index in range(params["fanout"])
+                ]
+        level = next_level
+    set_fixed_times(directory)
+    return directories, files, total_bytes
+
+
+def mutate_tree(directory, fraction=DEFAULT_MUTATE_FRACTION, seed=0):
+    """
+    Deterministically rewrite a fraction of the files of a tree and add as
+    many new ones, with an mtime that is not racily clean.
+    :return: The number of files changed or added
+    """
+    rng = random.Random(f"mutate:{seed}")
+    file_paths = sorted(
+        os.path.join(dirpath, name)
+        for dirpath, _, filenames in os.walk(directory)
+        for name in filenames
+        if not name.startswith(".") and name.endswith(".bin")
+    )
+    count = max(1, int(len(file_paths) * fraction))
+    touched = []
+    for file_path in rng.sample(file_paths, min(count, len(file_paths))):
+        with open(file_path, "ab") as f:
+            f.write(rng.randbytes(64))
+        touched.append(file_path)
+    for index in range(count):
+        dirpath = os.path.dirname(rng.choice(file_paths))
+        file_path = os.path.join(dirpath, f"added{index:05d}.bin")
+        with open(file_path, "wb") as f:
+            f.write(rng.randbytes(256))
+        touched.append(file_path)
+    for path in touched + sorted({os.path.dirname(path) for path in touched}):
+        os.utime(path, ns=(MUTATED_MTIME_NS, MUTATED_MTIME_NS))
+    return len(touched)
+
+
+def main():
+    """Generate one benchmark tree."""
+    parser = argparse.ArgumentParser(
+        description="Generate a deterministic directory tree for benchmarks."
+    )
+    parser.add_argument("directory", help="Directory to create the tree in.")
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="rerun")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Multiplier of the file count, or of the file size for huge-files.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directories, files, total_bytes = generate_tree(
+        args.directory, args.shape, args.scale, args.seed
+    )
+    print(f"{directories} directories, {files} files, {total_bytes} bytes")
+
+
+if __name__ == "__main__":
+    main()
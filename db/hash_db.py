@@ -1,34 +1,47 @@
 #!/usr/bin/env python3
 
-import sqlite3
-import logging
-
-
-def save_file_hash(db_file, file_path, file_hash, mtime):
-    """Save a file hash in the database."""
-    try:
-        with sqlite3.connect(db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO file_hashes (file_path, hash, mtime)
-                VALUES (?, ?, ?)""",
-                (file_path, file_hash, mtime),
-            )
-            conn.commit()
-    except sqlite3.Error as e:
-        logging.error(f"Failed to save hash for {file_path}: {e}")
-
-
-def load_hashes_from_db(db_file):
-    """Load file hashes from the database."""
-    hashes = {}
-    try:
-        with sqlite3.connect(db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT file_path, hash FROM file_hashes")
-            for row in cursor.fetchall():
-                hashes[row[0]] = row[1]
-    except sqlite3.Error as e:
-        logging.error(f"Failed to load hashes from the database: {e}")
-    return hashes
+import atexit
+from db.hash_store import HashStore
+from hashing.algorithms import DEFAULT_ALGORITHM
+
+# Shared HashStore per database file, so these helpers reuse one connection
+_stores = {}
+
+
+def get_hash_store(db_file):
+    """Return the shared HashStore of a database file, opening it on first use."""
+    store = _stores.get(db_file)
+    if store is None:
+        store = _stores[db_file] = HashStore(db_file)
+    return store
+
+
+@atexit.register
+def close_hash_stores():
+    """Flush and close the shared stores."""
+    for store in _stores.values():
+        store.close()
+    _stores.clear()
+
+
+def save_file_hash(
+    db_file,
+    file_path,
+    file_hash,
+    mtime,
+    signature=None,
+    algorithm=DEFAULT_ALGORITHM,
+    quick_hash=None,
+    verified_at=None,
+):
+    """Save a file hash in the database. See HashStore.save_file_hash."""
+    get_hash_store(db_file).save_file_hash(
+        file_path, file_hash, mtime, signature, algorithm, quick_hash, verified_at
+    )
+
+
+def save_file_chunks(db_file, file_path, hashed_size, digests, chunk_size):
+    """Save the chunk digests of an append-aware hash."""
+    get_hash_store(db_file).save_file_chunks(
+        file_path, hashed_size, digests, chunk_size
+    )
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+# Directories whose rows stay loaded at once. Files are looked up directory
+# by directory, so older directories are not needed again.
+DEFAULT_CACHED_DIRECTORIES = 64
+# Stand-in for NULL in the integer signature columns
+NULL = -(2**63)
+
+
+class DirectoryRows:
+    """
+    Stored rows of one directory in array-backed columns sorted by name.
+    Digests and quick hashes are kept as binary in one buffer each instead of
+    one hex string per row.
+    """
+
+    __slots__ = (
+        "names",
+        "digests",
+        "offsets",
+        "sizes",
+        "mtimes",
+        "inodes",
+        "ctimes",
+        "algorithms",
+        "quick_hashes",
+        "quick_offsets",
+        "verified",
+        "chunks",
+    )
+
+    def __init__(self, rows, chunks=()):
+        """
+        :param rows: (name, digest, size, mtime_ns, inode, ctime_ns, algorithm,
+        quick_hash, verified_at) tuples
+        :param chunks: (name, hashed_size, digests) tuples of the append-aware
+        hashes
+        """
+        self.names = []
+        digests = bytearray()
+        quick_hashes = bytearray()
+        self.offsets = array("I", [0])
+        self.quick_offsets = array("I", [0])
+        self.sizes, self.mtimes, self.inodes, self.ctimes = (
+            array("q") for _ in range(4)
+        )
+        self.algorithms = []
+        self.verified = array("d")
+        for name, digest, *row in sorted(rows):
+            *signature, algorithm, quick_hash, verified_at = row
+            digests += digest
+            quick_hashes += quick_hash or b""
+            self.names.append(name)
+            self.offsets.append(len(digests))
+            self.quick_offsets.append(len(quick_hashes))
+            for column, value in zip(
+                (self.sizes, self.mtimes, self.inodes, self.ctimes), signature
+            ):
+                column.append(NULL if value is None else value)
+            self.algorithms.append(sys.intern(algorithm))
+            self.verified.append(math.nan if verified_at is None else verified_at)
+        self.digests = bytes(digests)
+        self.quick_hashes = bytes(quick_hashes)
+        # Only large files have chunk digests, so a dict of them stays small
+        self.chunks = {name: (size, digests) for name, size, digests in chunks}
+
+    def find(self, name):
+        """Return the row index of a name, or None."""
+        index = bisect_left(self.names, name)
+        if index < len(self.names) and self.names[index] == name:
+            return index
+        return None
+
+    def hash(self, index):
+        """Return the hex digest of a row."""
+        return self.digests[self.offsets[index] : self.offsets[index + 1]].hex()
+
+    def signature(self, index):
+        """Return the (size, mtime_ns, inode, ctime_ns) signature of a row, or None."""
+        if self.sizes[index] == NULL:
+            return None
+        return tuple(
+            None if column[index] == NULL else column[index]
+            for column in (self.sizes, self.mtimes, self.inodes, self.ctimes)
+        )
+
+    def algorithm(self, index):
+        """Return the algorithm tag of a row."""
+        return self.algorithms[index]
+
+    def quick_record(self, index):
+        """Return the (hex quick_hash, verified_at) of a row, or None."""
+        start, end = self.quick_offsets[index], self.quick_offsets[index + 1]
+        if start == end:
+            return None
+        verified_at = self.verified[index]
+        return (
+            self.quick_hashes[start:end].hex(),
+            None if math.isnan(verified_at) else verified_at,
+        )
+
+    def chunk_record(self, index):
+        """Return the (hashed_size, digests) chunk list of a row, or None."""
+        return self.chunks.get(self.names[index])
+
+
+class HashIndex:
+    """
+    Read-only view of the stored file rows, loaded from a HashStore one
+    directory at a time instead of as one dict of the table.
+    Looks up like a dict of hex hashes; signatures, algorithms, quick_hashes
+    and chunks look up the other columns the same way.
+    """
+
+    def __init__(
+        self,
+        hash_store,
+        cached_directories=DEFAULT_CACHED_DIRECTORIES,
+        chunk_size=None,
+    ):
+        """
+        :param chunk_size: Chunk size of the chunk lists to load along with
+        the rows, or None to leave chunks empty
+        """
+        self.hash_store = hash_store
+        self.cached_directories = max(1, cached_directories)
+        self.chunk_size = chunk_size
+        self.directories = OrderedDict()
+        self.signatures = ColumnView(self, DirectoryRows.signature)
+        self.algorithms = ColumnView(self, DirectoryRows.algorithm)
+        self.quick_hashes = ColumnView(self, DirectoryRows.quick_record)
+        self.chunks = ColumnView(self, DirectoryRows.chunk_record)
+
+    def load_directory(self, dirpath):
+        """Return the rows of a directory, loading them from the database once."""
+        rows = self.directories.get(dirpath)
+        if rows is not None:
+            self.directories.move_to_end(dirpath)
+            return rows
+
+        # The (dir_id, name) primary key serves the lookups
+        chunks = ()
+        if self.chunk_size is not None:
+            chunks = list(
+                self.hash_store.iter_rows(
+                    """
+                    SELECT name, size, digests
+                    FROM chunks
+                    WHERE dir_id = (SELECT dir_id FROM directories WHERE path = ?)
+                    AND chunk_size = ?""",
+                    (dirpath, self.chunk_size),
+                    description=f"chunk digests of {dirpath}",
+                )
+            )
+        rows = DirectoryRows(
+            self.hash_store.iter_rows(
+                """
+                SELECT name, hash, size, mtime_ns, inode, ctime_ns,
+                    algorithm, quick_hash, verified_at
+                FROM files
+                WHERE dir_id = (SELECT dir_id FROM directories WHERE path = ?)""",
+                (dirpath,),
+                description=f"hashes of {dirpath}",
+            ),
+            chunks,
+        )
+        self.directories[sys.intern(dirpath)] = rows
+        while len(self.directories) > self.cached_directories:
+            self.directories.popitem(last=False)
+        return rows
+
+    def lookup(self, file_path):
+        """Return the (rows, index) of a file, with index None if it is not stored."""
+        dirpath, name = os.path.split(file_path)
+        rows = self.load_directory(dirpath)
+        return rows, rows.find(name)
+
+    def directory_files(self, dirpath):
+        """Return the stored (name, signature) pairs of a directory, sorted by name."""
+        rows = self.load_directory(dirpath)
+        return [(name, rows.signature(index)) for index, name in enumerate(rows.names)]
+
+    def get(self, file_path, default=None):
+        rows, index = self.lookup(file_path)
+        return default if index is None else rows.hash(index)
+
+    def __getitem__(self, file_path):
+        rows, index = self.lookup(file_path)
+        if index is None:
+            raise KeyError(file_path)
+        return rows.hash(index)
+
+    def __contains__(self, file_path):
+        return self.lookup(file_path)[1] is not None
+
+
+class ColumnView:
+    """dict-like access to one column of the rows of a HashIndex."""
+
+    def __init__(self, hash_index, column):
+        """:param column: DirectoryRows method returning the value of a row, or None"""
+        self.hash_index = hash_index
+        self.column = column
+
+    def get(self, file_path, default=None):
+        rows, index = self.hash_index.lookup(file_path)
+        value = None if index is None else self.column(rows, index)
+        return default if value is None else value
+
+    def __getitem__(self, file_path):
+        value = self.get(file_path)
+        if value is None:
+            raise KeyError(file_path)
+        return value
+
+    def __contains__(self, file_path):
+        return self.get(file_path) is not None
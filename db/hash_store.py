@@ -0,0 +1,951 @@
+#!/usr/bin/env python3
+
+import functools
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from db.migrations import apply_migrations
+from db.schema_manager import DB_FILE
+from hashing.algorithms import DEFAULT_ALGORITHM
+
+# Rows buffered per table before they are written in one transaction
+DEFAULT_BATCH_SIZE = 1000
+# SQLite page cache size in KiB
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024
+# Rows fetched per call while streaming query results
+FETCH_SIZE = 1000
+
+# Kinds of the changes recorded for a scan run
+CHANGE_MODIFIED = "modified"  # New or modified file
+CHANGE_DELETED = "deleted"
+CHANGE_DIRECTORY = "directory"  # New directory
+
+
+def subtree_bounds(directory):
+    """Return the (lower, upper) bounds of the paths below a directory."""
+    prefix = os.path.join(directory, "")
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def directory_scope(column, directory):
+    """
+    Return an SQL condition matching a directory path column against a
+    directory and every directory below it, with its parameters.
+    """
+    return (
+        f"({column} = ? OR ({column} >= ? AND {column} < ?))",
+        (directory, *subtree_bounds(directory)),
+    )
+
+
+def shard_scope(column, path, recursive=True):
+    """
+    Return an SQL condition matching a directory path column against a shard
+    scope, with its parameters: the directory and, if recursive, its subtree.
+    """
+    if recursive:
+        return directory_scope(column, path)
+    return f"{column} = ?", (path,)
+
+
+def database_operation(method):
+    """Time a HashStore method in the db stage of the attached ScanMetrics."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.timed():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class HashStore:
+    """
+    One SQLite connection for a whole run.
+    Writes are buffered and flushed with executemany inside explicit
+    transactions, so a run costs one commit per batch instead of per file.
+    Reads flush pending writes first so they always see them.
+    Paths are split into a directory row and a file name, and hex digests
+    are stored as binary.
+    When metrics holds a ScanMetrics, database time is counted in its db
+    stage, with the latency of each batch and query in histograms.
+    """
+
+    def __init__(
+        self,
+        db_file=DB_FILE,
+        batch_size=DEFAULT_BATCH_SIZE,
+        cache_size_kib=DEFAULT_CACHE_SIZE_KIB,
+    ):
+        self.db_file = db_file
+        self.batch_size = max(1, batch_size)
+        # Autocommit mode: transactions are opened explicitly in flush()
+        self.conn = sqlite3.connect(db_file, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA cache_size=-{cache_size_kib}")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        apply_migrations(self.conn)
+        self.dir_ids = {}
+        self.pending_hashes = []
+        self.pending_chunks = []
+        self.pending_skipped = []
+        self.pending_directories = []
+        self.pending_readmes = []
+        self.pending_run_changes = []
+        self.pending_run_directories = []
+        self.metrics = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Flush pending writes and close the connection."""
+        if self.conn is None:
+            return
+        self.flush()
+        self.conn.close()
+        self.conn = None
+
+    @contextmanager
+    def timed(self, histogram=None):
+        """Time a block in the db stage, recording its latency in a histogram."""
+        if self.metrics is None:
+            yield
+            return
+        start = time.perf_counter()
+        with self.metrics.stage("db"):
+            yield
+        if histogram is not None:
+            self.metrics.observe(histogram, time.perf_counter() - start)
+
+    def pending_buffers(self):
+        """Return the lists of buffered rows, one per kind of write."""
+        return (
+            self.pending_hashes,
+            self.pending_chunks,
+            self.pending_skipped,
+            self.pending_directories,
+            self.pending_readmes,
+            self.pending_run_changes,
+            self.pending_run_directories,
+        )
+
+    def flush(self):
+        """Write every buffered row in a single transaction."""
+        rows = sum(map(len, self.pending_buffers()))
+        if not rows:
+            return
+        with self.timed("db_batch_seconds"):
+            self.write_pending()
+        if self.metrics is not None:
+            self.metrics.increment("db_batches")
+            self.metrics.increment("db_rows_written", rows)
+
+    def write_pending(self):
+        """Write the buffered rows for flush() and clear the buffers."""
+        try:
+            self.conn.execute("BEGIN")
+            # Upsert rather than replace, which would give the row a new dir_id
+            self.conn.executemany(
+                """
+                INSERT INTO directories (
+                    path, size, mtime_ns, inode, ctime_ns, tree_hash
+                )
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    inode = excluded.inode,
+                    ctime_ns = excluded.ctime_ns,
+                    tree_hash = excluded.tree_hash""",
+                self.pending_directories,
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO directories (path, readme_digest, readme_pages)
+                VALUES (?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    readme_digest = excluded.readme_digest,
+                    readme_pages = excluded.readme_pages""",
+                self.pending_readmes,
+            )
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO files (
+                    dir_id, name, hash, mtime, size, mtime_ns, inode, ctime_ns,
+                    algorithm, quick_hash, verified_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (*self.split_path(file_path), *row)
+                    for file_path, *row in self.pending_hashes
+                ],
+            )
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO chunks (dir_id, name, chunk_size, size, digests)
+                VALUES (?, ?, ?, ?, ?)""",
+                [
+                    (*self.split_path(file_path), *row)
+                    for file_path, *row in self.pending_chunks
+                ],
+            )
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO skipped_files (file_path, reason)
+                VALUES (?, ?)""",
+                self.pending_skipped,
+            )
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO run_changes (run_id, path, kind)
+                VALUES (?, ?, ?)""",
+                self.pending_run_changes,
+            )
+            # Deleted files leave the database along with the change recording it
+            deleted_keys = [
+                key
+                for _, path, kind in self.pending_run_changes
+                if kind == CHANGE_DELETED
+                for key in [self.stored_key(path)]
+                if key is not None
+            ]
+            for table in ("files", "chunks"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE dir_id = ? AND name = ?", deleted_keys
+                )
+            self.conn.executemany(
+                """
+                INSERT OR IGNORE INTO run_directories (run_id, path)
+                VALUES (?, ?)""",
+                self.pending_run_directories,
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to write a batch to the database: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            self.dir_ids.clear()  # Ids inserted by the rolled back batch
+        for pending in self.pending_buffers():
+            pending.clear()
+
+    def directory_id(self, dirpath, create=True):
+        """Return the dir_id of a directory path, inserting it when create is set."""
+        dir_id = self.dir_ids.get(dirpath)
+        if dir_id is None:
+            row = self.conn.execute(
+                "SELECT dir_id FROM directories WHERE path = ?", (dirpath,)
+            ).fetchone()
+            if row is None:
+                if not create:
+                    return None
+                dir_id = self.conn.execute(
+                    "INSERT INTO directories (path) VALUES (?)", (dirpath,)
+                ).lastrowid
+            else:
+                dir_id = row[0]
+            self.dir_ids[dirpath] = dir_id
+        return dir_id
+
+    def split_path(self, file_path):
+        """Return the (dir_id, name) key of a file path."""
+        dirpath, name = os.path.split(file_path)
+        return self.directory_id(dirpath), name
+
+    def buffer(self, pending, row):
+        """Queue a row and flush once a table reaches the batch size."""
+        pending.append(row)
+        if len(pending) >= self.batch_size:
+            self.flush()
+
+    def save_file_hash(
+        self,
+        file_path,
+        file_hash,
+        mtime,
+        signature=None,
+        algorithm=DEFAULT_ALGORITHM,
+        quick_hash=None,
+        verified_at=None,
+    ):
+        """
+        Queue a file hash for saving.
+        :param file_hash: Hex digest, stored as binary
+        :param signature: (size, mtime_ns, inode, ctime_ns) stat signature, with
+        mtime_ns None when the hash must not be trusted on the next run
+        :param algorithm: Algorithm tag the hash was computed with
+        :param quick_hash: Sampled fingerprint of large files
+        :param verified_at: Time the full hash was last computed for a quick-hashed file
+        """
+        size, mtime_ns, inode, ctime_ns = signature or (None, None, None, None)
+        self.buffer(
+            self.pending_hashes,
+            (
+                file_path,
+                bytes.fromhex(file_hash),
+                mtime,
+                size,
+                mtime_ns,
+                inode,
+                ctime_ns,
+                algorithm,
+                None if quick_hash is None else bytes.fromhex(quick_hash),
+                verified_at,
+            ),
+        )
+
+    def save_file_chunks(self, file_path, hashed_size, digests, chunk_size):
+        """Queue the chunk digests of an append-aware hash for saving."""
+        self.buffer(self.pending_chunks, (file_path, chunk_size, hashed_size, digests))
+
+    def save_directory(self, dirpath, signature, tree_hash):
+        """
+        Queue the state of a scanned directory for saving.
+        :param signature: (size, mtime_ns, inode, ctime_ns) of the directory, with
+        mtime_ns None when it must not be trusted on the next run
+        :param tree_hash: Binary Merkle hash of the directory, or None if unknown
+        """
+        self.buffer(
+            self.pending_directories,
+            (dirpath, *(signature or (None, None, None, None)), tree_hash),
+        )
+
+    def save_readme_digest(self, dirpath, digest, pages=1):
+        """
+        Queue the digest of the README content last written to a directory.
+        :param pages: Number of pages the README was written as
+        """
+        self.buffer(self.pending_readmes, (dirpath, digest, pages))
+
+    def log_skipped_file(self, file_path, reason):
+        """Queue a skipped file and its reason for the skipped_files table."""
+        self.buffer(self.pending_skipped, (file_path, reason))
+
+    def save_run_change(self, run_id, path, kind):
+        """
+        Queue a change found by a scan run, see the CHANGE_ kinds. The rows of
+        a deleted file are removed in the same transaction.
+        """
+        self.buffer(self.pending_run_changes, (run_id, path, kind))
+
+    def save_run_directory(self, run_id, dirpath):
+        """Queue a directory whose whole subtree a scan run has finished."""
+        self.buffer(self.pending_run_directories, (run_id, dirpath))
+
+    def stored_key(self, file_path):
+        """Return the (dir_id, name) of a path without creating its directory row."""
+        dirpath, name = os.path.split(file_path)
+        dir_id = self.directory_id(dirpath, create=False)
+        return None if dir_id is None else (dir_id, name)
+
+    def load_directory_states(self, directory):
+        """
+        Return the stored directories at or below a directory, mapped to their
+        (signature, tree_hash), with signature None if it was never recorded.
+        """
+        scope, params = directory_scope("path", directory)
+        return {
+            path: (None if size is None else (size, *signature), tree_hash)
+            for path, size, *signature, tree_hash in self.iter_rows(
+                f"""
+                SELECT path, size, mtime_ns, inode, ctime_ns, tree_hash
+                FROM directories
+                WHERE {scope}""",
+                params,
+                description="directories",
+            )
+        }
+
+    @database_operation
+    def load_readme_digests(self, dirpaths):
+        """Return the stored README digests of the given directories, by path."""
+        self.flush()
+        digests = {}
+        try:
+            for dirpath in dirpaths:
+                row = self.conn.execute(
+                    """
+                    SELECT readme_digest FROM directories
+                    WHERE path = ? AND readme_digest IS NOT NULL""",
+                    (dirpath,),
+                ).fetchone()
+                if row is not None:
+                    digests[dirpath] = row[0]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load README digests from the database: {e}")
+        return digests
+
+    def load_readme_pages(self, dirpath):
+        """Return the stored number of README pages of a directory, or None."""
+        self.flush()
+        try:
+            row = self.conn.execute(
+                "SELECT readme_pages FROM directories WHERE path = ?", (dirpath,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load README pages from the database: {e}")
+            return None
+        return None if row is None else row[0]
+
+    @database_operation
+    def start_scan_run(self, root):
+        """
+        Record a new scan run of a root directory, dropping the progress of its
+        earlier unfinished runs.
+        :return: The run_id, or None if the run could not be recorded
+        """
+        self.flush()
+        try:
+            self.conn.execute("BEGIN")
+            stale_runs = self.conn.execute(
+                "SELECT run_id FROM scan_runs WHERE root = ? AND finished_at IS NULL",
+                (root,),
+            ).fetchall()
+            for table in ("run_changes", "run_directories", "scan_runs"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE run_id = ?", stale_runs
+                )
+            run_id = self.conn.execute(
+                "INSERT INTO scan_runs (root, started_at) VALUES (?, ?)",
+                (root, time.time()),
+            ).lastrowid
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record the scan run in the database: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            return None
+        return run_id
+
+    @database_operation
+    def find_interrupted_run(self, root):
+        """Return the run_id of the last unfinished run of a root, or None."""
+        self.flush()
+        try:
+            row = self.conn.execute(
+                """
+                SELECT MAX(run_id) FROM scan_runs
+                WHERE root = ? AND finished_at IS NULL""",
+                (root,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load the scan runs from the database: {e}")
+            return None
+        return row[0]
+
+    @database_operation
+    def finish_scan_run(self, run_id):
+        """Mark a scan run finished and drop its recorded progress."""
+        self.flush()
+        try:
+            self.conn.execute("BEGIN")
+            for table in ("run_changes", "run_directories"):
+                self.conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (run_id,))
+            self.conn.execute(
+                "UPDATE scan_runs SET finished_at = ? WHERE run_id = ?",
+                (time.time(), run_id),
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to finish the scan run in the database: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+
+    def scope_differences(self, path, recursive=True):
+        """
+        Compare the rows of a shard scope with those of the database attached
+        as source.
+        :return: (changes, deleted, added_directories, removed_directories)
+        with changes the source files that are new or whose content changed
+        """
+        scope, params = shard_scope("d.path", path, recursive)
+        source_scope, _ = shard_scope("s.path", path, recursive)
+        changes = [
+            os.path.join(dirpath, name)
+            for dirpath, name in self.conn.execute(
+                f"""
+                SELECT s.path, t.name
+                FROM source.files AS t
+                JOIN source.directories AS s ON s.dir_id = t.dir_id
+                LEFT JOIN directories AS d ON d.path = s.path
+                LEFT JOIN files AS f ON f.dir_id = d.dir_id AND f.name = t.name
+                WHERE {source_scope} AND (
+                    f.hash IS NULL
+                    OR (f.algorithm = t.algorithm AND f.hash != t.hash)
+                    OR (
+                        f.algorithm != t.algorithm
+                        AND (f.size IS NOT t.size OR f.mtime_ns IS NOT t.mtime_ns)
+                    )
+                )""",
+                params,
+            )
+        ]
+        deleted = [
+            os.path.join(dirpath, name)
+            for dirpath, name in self.conn.execute(
+                f"""
+                SELECT d.path, f.name
+                FROM files AS f JOIN directories AS d ON d.dir_id = f.dir_id
+                WHERE {scope} AND NOT EXISTS (
+                    SELECT 1
+                    FROM source.files AS t
+                    JOIN source.directories AS s ON s.dir_id = t.dir_id
+                    WHERE s.path = d.path AND t.name = f.name
+                )""",
+                params,
+            )
+        ]
+        added_directories = [
+            dirpath
+            for (dirpath,) in self.conn.execute(
+                f"""
+                SELECT s.path FROM source.directories AS s
+                WHERE {source_scope}
+                AND s.path NOT IN (SELECT path FROM directories)""",
+                params,
+            )
+        ]
+        removed_directories = [
+            dirpath
+            for (dirpath,) in self.conn.execute(
+                f"""
+                SELECT d.path FROM directories AS d
+                WHERE {scope}
+                AND d.path NOT IN (SELECT path FROM source.directories)""",
+                params,
+            )
+        ]
+        return changes, deleted, added_directories, removed_directories
+
+    def replace_scope(self, path, recursive=True):
+        """
+        Replace the rows of a shard scope with those of the database attached
+        as source, inside the caller's transaction. The README digests of the
+        directories that remain are kept.
+        """
+        scope, params = shard_scope("path", path, recursive)
+        source_scope, _ = shard_scope("s.path", path, recursive)
+        for table in ("files", "chunks"):
+            self.conn.execute(
+                f"""
+                DELETE FROM {table}
+                WHERE dir_id IN (SELECT dir_id FROM directories WHERE {scope})""",
+                params,
+            )
+        self.conn.execute(
+            f"""
+            DELETE FROM directories
+            WHERE {scope}
+            AND path NOT IN (SELECT path FROM source.directories WHERE {scope})""",
+            params + params,
+        )
+        self.conn.execute(
+            f"""
+            INSERT INTO directories (path, size, mtime_ns, inode, ctime_ns, tree_hash)
+            SELECT path, size, mtime_ns, inode, ctime_ns, tree_hash
+            FROM source.directories
+            WHERE {scope}
+            ON CONFLICT (path) DO UPDATE SET
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode,
+                ctime_ns = excluded.ctime_ns,
+                tree_hash = excluded.tree_hash""",
+            params,
+        )
+        for table, columns in (
+            (
+                "files",
+                "hash, mtime, size, mtime_ns, inode, ctime_ns, algorithm, "
+                "quick_hash, verified_at",
+            ),
+            ("chunks", "chunk_size, size, digests"),
+        ):
+            source_columns = ", ".join(f"t.{column}" for column in columns.split(", "))
+            self.conn.execute(
+                f"""
+                INSERT INTO {table} (dir_id, name, {columns})
+                SELECT d.dir_id, t.name, {source_columns}
+                FROM source.{table} AS t
+                JOIN source.directories AS s ON s.dir_id = t.dir_id
+                JOIN directories AS d ON d.path = s.path
+                WHERE {source_scope}""",
+                params,
+            )
+
+        # skipped_files is keyed by path and small, so it is filtered per row
+        stale_skipped, skipped = (
+            [
+                (file_path, reason)
+                for file_path, reason in self.conn.execute(
+                    f"""
+                    SELECT file_path, reason FROM {schema}.skipped_files
+                    WHERE file_path >= ? AND file_path < ?""",
+                    subtree_bounds(path),
+                ).fetchall()
+                if recursive or os.path.dirname(file_path) == path
+            ]
+            for schema in ("main", "source")
+        )
+        self.conn.executemany(
+            "DELETE FROM skipped_files WHERE file_path = ?",
+            ((file_path,) for file_path, _ in stale_skipped),
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO skipped_files (file_path, reason) VALUES (?, ?)",
+            skipped,
+        )
+
+    @database_operation
+    def seed_shard(self, main_db, scopes):
+        """
+        Reset a shard database to the rows the main database holds within the
+        scopes of the shard, and record the scopes.
+        :param scopes: (path, recursive) pairs, see the shard_scopes table
+        """
+        self.flush()
+        attached = False
+        try:
+            if os.path.exists(main_db):
+                self.conn.execute("ATTACH DATABASE ? AS source", (main_db,))
+                attached = True
+            self.conn.execute("BEGIN")
+            for table in (
+                "files",
+                "chunks",
+                "skipped_files",
+                "directories",
+                "shard_scopes",
+            ):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.executemany(
+                "INSERT INTO shard_scopes (path, recursive) VALUES (?, ?)", scopes
+            )
+            if attached:
+                for path, recursive in scopes:
+                    self.replace_scope(path, recursive)
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to seed the shard database from {main_db}: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+        finally:
+            self.dir_ids.clear()
+            if attached:
+                self.conn.execute("DETACH DATABASE source")
+
+    @database_operation
+    def merge_shard(self, shard_db):
+        """
+        Merge a shard database: within each scope the shard scanned, its rows
+        replace the stored ones, through bulk INSERT ... SELECT statements in
+        one transaction. A shard whose last scan did not finish is refused.
+        :return: (changes, deleted, added_directories, removed_directories)
+        against the rows stored before the merge, or None if the shard could
+        not be merged
+        """
+        self.flush()
+        if not os.path.exists(shard_db):
+            logging.error(f"Shard database {shard_db} does not exist")
+            return None
+        try:
+            self.conn.execute("ATTACH DATABASE ? AS source", (shard_db,))
+        except sqlite3.Error as e:
+            logging.error(f"Failed to open the shard database {shard_db}: {e}")
+            return None
+        differences = [], [], [], []
+        try:
+            row = self.conn.execute(
+                "SELECT finished_at FROM source.scan_runs ORDER BY run_id DESC LIMIT 1"
+            ).fetchone()
+            if row is None or row[0] is None:
+                logging.error(f"The last scan of shard {shard_db} did not finish")
+                return None
+            scopes = self.conn.execute(
+                "SELECT path, recursive FROM source.shard_scopes"
+            ).fetchall()
+            self.conn.execute("BEGIN")
+            for path, recursive in scopes:
+                for collected, found in zip(
+                    differences, self.scope_differences(path, recursive)
+                ):
+                    collected.extend(found)
+                self.replace_scope(path, recursive)
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to merge the shard database {shard_db}: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            differences = None
+        finally:
+            self.dir_ids.clear()
+            self.conn.execute("DETACH DATABASE source")
+        return differences
+
+    def create_seen_files(self):
+        """Create the temporary table of the files seen by the current scan."""
+        self.conn.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS seen_files (
+                dir_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                PRIMARY KEY (dir_id, name)
+            ) WITHOUT ROWID"""
+        )
+
+    @database_operation
+    def mark_seen(self, file_paths):
+        """
+        Record files seen by the current scan for prune_unseen, e.g. one
+        checkpoint chunk at a time. Files without a stored row are ignored.
+        """
+        self.flush()
+        try:
+            self.conn.execute("BEGIN")
+            self.create_seen_files()
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_files (dir_id, name) VALUES (?, ?)",
+                filter(None, map(self.stored_key, file_paths)),
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record seen files: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+
+    @database_operation
+    def mark_run_seen(self, run_id):
+        """Record the stored files of the directories a scan run finished as seen."""
+        try:
+            self.conn.execute("BEGIN")
+            self.create_seen_files()
+            self.conn.execute(
+                """
+                INSERT OR IGNORE INTO seen_files (dir_id, name)
+                SELECT f.dir_id, f.name
+                FROM files AS f JOIN directories AS d USING (dir_id)
+                WHERE d.path IN (SELECT path FROM run_directories WHERE run_id = ?)""",
+                (run_id,),
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record the files of a scan run as seen: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+
+    @database_operation
+    def forget_seen(self):
+        """Drop the files recorded by mark_seen, e.g. before a scan starts."""
+        try:
+            self.create_seen_files()
+            self.conn.execute("DELETE FROM seen_files")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to clear the seen files: {e}")
+
+    @database_operation
+    def prune_unseen(self, directory, seen_paths=(), seen_directories=()):
+        """
+        Delete the rows of the files below a directory that the scan did not
+        see: neither in seen_paths nor recorded with mark_seen since the last
+        prune. The seen paths are streamed into a temporary table and the
+        stale rows are found with one anti-join on the (dir_id, name) key,
+        then removed in bulk along with their chunk lists, skipped-file
+        entries and directories left empty, except the ones in
+        seen_directories.
+        :return: The removed file paths
+        """
+        self.flush()
+        scope, params = directory_scope("path", directory)
+        unseen = """NOT EXISTS (
+            SELECT 1 FROM seen_files AS s
+            WHERE s.dir_id = {table}.dir_id AND s.name = {table}.name
+        )"""
+        try:
+            self.conn.execute("BEGIN")
+            self.create_seen_files()
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_files (dir_id, name) VALUES (?, ?)",
+                filter(None, map(self.stored_key, seen_paths)),
+            )
+
+            removed = [
+                os.path.join(dirpath, name)
+                for dirpath, name in self.conn.execute(
+                    f"""
+                    SELECT directories.path, files.name
+                    FROM files JOIN directories USING (dir_id)
+                    WHERE {scope} AND {unseen.format(table="files")}""",
+                    params,
+                )
+            ]
+            for table in ("files", "chunks"):
+                self.conn.execute(
+                    f"""
+                    DELETE FROM {table}
+                    WHERE dir_id IN (SELECT dir_id FROM directories WHERE {scope})
+                    AND {unseen.format(table=table)}""",
+                    params,
+                )
+
+            # skipped_files is keyed by path and small, so it is checked per row
+            stale_skipped = []
+            for (file_path,) in self.conn.execute(
+                """
+                SELECT file_path FROM skipped_files
+                WHERE file_path >= ? AND file_path < ?""",
+                subtree_bounds(directory),
+            ).fetchall():
+                key = self.stored_key(file_path)
+                if (
+                    key is None
+                    or not self.conn.execute(
+                        "SELECT 1 FROM seen_files WHERE dir_id = ? AND name = ?", key
+                    ).fetchone()
+                ):
+                    stale_skipped.append((file_path,))
+            self.conn.executemany(
+                "DELETE FROM skipped_files WHERE file_path = ?", stale_skipped
+            )
+
+            self.conn.execute(
+                """
+                CREATE TEMP TABLE IF NOT EXISTS seen_directories (
+                    path TEXT PRIMARY KEY
+                ) WITHOUT ROWID"""
+            )
+            self.conn.execute("DELETE FROM seen_directories")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO seen_directories (path) VALUES (?)",
+                ((path,) for path in seen_directories),
+            )
+            self.conn.execute(
+                f"""
+                DELETE FROM directories
+                WHERE {scope}
+                AND path NOT IN (SELECT path FROM seen_directories)
+                AND dir_id NOT IN (SELECT dir_id FROM files)
+                AND dir_id NOT IN (SELECT dir_id FROM chunks)""",
+                params,
+            )
+            self.conn.execute("DELETE FROM seen_files")
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to prune deleted files from the database: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            removed = []
+        self.dir_ids.clear()
+        return removed
+
+    @database_operation
+    def delete_files(self, file_paths):
+        """Delete the rows of removed files, with their chunk lists."""
+        self.flush()
+        keys = [key for key in map(self.stored_key, file_paths) if key is not None]
+        if not keys:
+            return
+        try:
+            self.conn.execute("BEGIN")
+            for table in ("files", "chunks"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE dir_id = ? AND name = ?", keys
+                )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete removed files from the database: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+
+    @database_operation
+    def invalidate_tree_hashes(self, dirpaths):
+        """
+        Clear the tree hash of directories and all their ancestors, so the next
+        scan lists them again instead of trusting their stored state.
+        """
+        self.flush()
+        paths = set()
+        for dirpath in dirpaths:
+            while dirpath not in paths:
+                paths.add(dirpath)
+                dirpath = os.path.dirname(dirpath)
+        try:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE directories SET tree_hash = NULL WHERE path = ?",
+                ((path,) for path in paths),
+            )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to clear directory tree hashes: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+
+    def iter_rows(self, query, params=(), description="rows"):
+        """Run a query and yield its rows as they are fetched."""
+        self.flush()
+        try:
+            with self.timed("db_query_seconds"):
+                cursor = self.conn.execute(query, params)
+                rows = cursor.fetchmany(FETCH_SIZE)
+            while rows:
+                yield from rows
+                with self.timed():
+                    rows = cursor.fetchmany(FETCH_SIZE)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load {description} from the database: {e}")
+
+    def load_run_changes(self, run_id):
+        """Load the (path, kind) changes recorded by a scan run."""
+        return list(
+            self.iter_rows(
+                "SELECT path, kind FROM run_changes WHERE run_id = ?",
+                (run_id,),
+                description="scan run changes",
+            )
+        )
+
+    def load_run_directories(self, run_id):
+        """Load the directories whose whole subtree a scan run has finished."""
+        return {
+            path
+            for (path,) in self.iter_rows(
+                "SELECT path FROM run_directories WHERE run_id = ?",
+                (run_id,),
+                description="scan run directories",
+            )
+        }
+
+    def load_run_file_counts(self, run_id):
+        """Load the stored file count of each directory a scan run has finished."""
+        return dict(
+            self.iter_rows(
+                """
+                SELECT d.path, COUNT(*)
+                FROM files AS f JOIN directories AS d ON d.dir_id = f.dir_id
+                WHERE d.path IN (SELECT path FROM run_directories WHERE run_id = ?)
+                GROUP BY d.dir_id""",
+                (run_id,),
+                description="file counts of the finished directories",
+            )
+        )
+
+    def load_directory_sizes(self, directory):
+        """Load the total stored file size of each directory at or below a directory."""
+        scope, params = directory_scope("d.path", directory)
+        return dict(
+            self.iter_rows(
+                f"""
+                SELECT d.path, COALESCE(SUM(f.size), 0)
+                FROM files AS f JOIN directories AS d ON d.dir_id = f.dir_id
+                WHERE {scope}
+                GROUP BY d.dir_id""",
+                params,
+                description="directory sizes",
+            )
+        )
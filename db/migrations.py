@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+
+# Version recorded in PRAGMA user_version once every migration has run
+SCHEMA_VERSION = 7
+# Rows read and rewritten at once while migrating a table
+MIGRATION_BATCH_SIZE = 1000
+
+# Stat signature and digest columns added to file_hashes after the initial
+# schema. Rows written before the algorithm tag existed are md5 digests.
+# quick_hash holds the sampled fingerprint of large files, a distinct kind
+# of hash that is never compared with the full content hash.
+FILE_HASHES_COLUMNS = {
+    "size": "INTEGER",
+    "mtime_ns": "INTEGER",
+    "inode": "INTEGER",
+    "ctime_ns": "INTEGER",
+    "algorithm": "TEXT NOT NULL DEFAULT 'md5'",
+    "quick_hash": "TEXT",
+    "verified_at": "REAL",
+}
+
+
+def add_missing_columns(cursor, table, columns):
+    """Add the columns that an existing table is missing."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+            logging.info(f"Added column {name} to {table}")
+
+
+def migrate_to_v1(cursor):
+    """
+    Flat schema keyed by absolute path. Databases created before versioning
+    have user_version 0 and any subset of these tables and columns.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            file_path TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            mtime REAL NOT NULL
+        )
+    """
+    )
+    add_missing_columns(cursor, "file_hashes", FILE_HASHES_COLUMNS)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS file_chunks (
+            file_path TEXT PRIMARY KEY,
+            chunk_size INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            digests BLOB NOT NULL
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS skipped_files (
+            file_path TEXT PRIMARY KEY,
+            reason TEXT
+        )
+    """
+    )
+
+
+def from_hex(value):
+    """Return the binary form of a hex digest, or None if it is not one."""
+    try:
+        return bytes.fromhex(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_batches(cursor, query, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Run a query on a cursor of its own and yield its rows in batches, so the
+    given cursor can write while the rows are read.
+    """
+    reader = cursor.connection.cursor()
+    try:
+        reader.execute(query)
+        while rows := reader.fetchmany(batch_size):
+            yield rows
+    finally:
+        reader.close()
+
+
+def migrate_to_v2(cursor):
+    """
+    Store each directory path once and key files by (dir_id, name), with
+    binary digests. Rows whose hash is not a hex digest are dropped, so
+    their files are rehashed on the next run.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE directories (
+            dir_id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE files (
+            dir_id INTEGER NOT NULL REFERENCES directories (dir_id),
+            name TEXT NOT NULL,
+            hash BLOB NOT NULL,
+            mtime REAL NOT NULL,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            ctime_ns INTEGER,
+            algorithm TEXT NOT NULL DEFAULT 'md5',
+            quick_hash BLOB,
+            verified_at REAL,
+            PRIMARY KEY (dir_id, name)
+        ) WITHOUT ROWID
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE chunks (
+            dir_id INTEGER NOT NULL REFERENCES directories (dir_id),
+            name TEXT NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            digests BLOB NOT NULL,
+            PRIMARY KEY (dir_id, name)
+        ) WITHOUT ROWID
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX files_quick_hash ON files (dir_id) WHERE quick_hash IS NOT NULL"
+    )
+
+    dir_ids = {}
+
+    def split(file_path):
+        dirpath, name = os.path.split(file_path)
+        if dirpath not in dir_ids:
+            cursor.execute("INSERT INTO directories (path) VALUES (?)", (dirpath,))
+            dir_ids[dirpath] = cursor.lastrowid
+        return dir_ids[dirpath], name
+
+    migrated = 0
+    for rows in iter_batches(
+        cursor,
+        """
+        SELECT file_path, hash, mtime, size, mtime_ns, inode, ctime_ns,
+            algorithm, quick_hash, verified_at
+        FROM file_hashes""",
+    ):
+        batch = []
+        for file_path, file_hash, mtime, *columns in rows:
+            *signature, algorithm, quick_hash, verified_at = columns
+            digest = from_hex(file_hash)
+            if digest is None:
+                continue
+            batch.append(
+                (
+                    *split(file_path),
+                    digest,
+                    mtime,
+                    *signature,
+                    algorithm,
+                    from_hex(quick_hash),
+                    verified_at,
+                )
+            )
+        cursor.executemany(
+            """
+            INSERT INTO files (
+                dir_id, name, hash, mtime, size, mtime_ns, inode, ctime_ns,
+                algorithm, quick_hash, verified_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            batch,
+        )
+        migrated += len(batch)
+
+    for rows in iter_batches(
+        cursor, "SELECT file_path, chunk_size, size, digests FROM file_chunks"
+    ):
+        cursor.executemany(
+            """
+            INSERT INTO chunks (dir_id, name, chunk_size, size, digests)
+            VALUES (?, ?, ?, ?, ?)""",
+            [
+                (*split(file_path), chunk_size, size, digests)
+                for file_path, chunk_size, size, digests in rows
+            ],
+        )
+
+    cursor.execute("DROP TABLE file_hashes")
+    cursor.execute("DROP TABLE file_chunks")
+    logging.info(f"Migrated {migrated} file hashes to the directory schema")
+
+
+def migrate_to_v3(cursor):
+    """
+    Give directories a stat signature and a Merkle tree hash of their files
+    and subdirectories. Both start NULL, so no directory is trusted until a
+    scan has recorded it.
+    """
+    add_missing_columns(
+        cursor,
+        "directories",
+        {
+            "size": "INTEGER",
+            "mtime_ns": "INTEGER",
+            "inode": "INTEGER",
+            "ctime_ns": "INTEGER",
+            "tree_hash": "BLOB",
+        },
+    )
+
+
+def migrate_to_v4(cursor):
+    """
+    Record a digest of the README last rendered into each directory, so an
+    unchanged README can be skipped without reading it back.
+    """
+    add_missing_columns(cursor, "directories", {"readme_digest": "BLOB"})
+
+
+def migrate_to_v5(cursor):
+    """
+    Record scan runs and their progress, so an interrupted scan can resume.
+    run_changes holds the changes a run already persisted, and
+    run_directories the directories whose whole subtree it finished.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE scan_runs (
+            run_id INTEGER PRIMARY KEY,
+            root TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE run_changes (
+            run_id INTEGER NOT NULL REFERENCES scan_runs (run_id),
+            path TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            PRIMARY KEY (run_id, path)
+        ) WITHOUT ROWID
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE run_directories (
+            run_id INTEGER NOT NULL REFERENCES scan_runs (run_id),
+            path TEXT NOT NULL,
+            PRIMARY KEY (run_id, path)
+        ) WITHOUT ROWID
+    """
+    )
+
+
+def migrate_to_v6(cursor):
+    """
+    Record the scopes of a shard database: directories whose whole subtree
+    it scanned, or with recursive 0 only the files directly in them.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE shard_scopes (
+            path TEXT PRIMARY KEY,
+            recursive INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """
+    )
+
+
+def migrate_to_v7(cursor):
+    """
+    Record the number of README pages written with each README digest, so
+    only those README-N.md files are taken for continuation pages.
+    """
+    add_missing_columns(cursor, "directories", {"readme_pages": "INTEGER"})
+
+
+# Migrations in order; each one upgrades the schema to its version
+MIGRATIONS = [
+    (1, migrate_to_v1),
+    (2, migrate_to_v2),
+    (3, migrate_to_v3),
+    (4, migrate_to_v4),
+    (5, migrate_to_v5),
+    (6, migrate_to_v6),
+    (7, migrate_to_v7),
+]
+
+
+def apply_migrations(conn):
+    """
+    Bring a database up to SCHEMA_VERSION, one transaction per migration.
+    :param conn: Connection in autocommit mode (isolation_level=None)
+    :return: The schema version of the database
+    """
+    cursor = conn.cursor()
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for target, migrate in MIGRATIONS:
+        if version >= target:
+            continue
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while this one waited
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version >= target:
+                cursor.execute("COMMIT")
+                continue
+            migrate(cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        logging.info(f"Migrated database schema from version {version} to {target}")
+        version = target
+    return version
@@ -2,33 +2,19 @@
 
 import sqlite3
 import logging
+from db.migrations import apply_migrations
 
 DB_FILE = "file_hashes.db"
 
 
-def create_database():
-    """Create the database schema for storing file hashes."""
+def create_database(db_file=DB_FILE):
+    """Create the database schema for storing file hashes, or upgrade it in place."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS file_hashes (
-                    file_path TEXT PRIMARY KEY,
-                    hash TEXT NOT NULL,
-                    mtime REAL NOT NULL
-                )
-            """
-            )
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS skipped_files (
-                    file_path TEXT PRIMARY KEY,
-                    reason TEXT
-                )
-            """
-            )
-            conn.commit()
-            logging.info(f"Database created/verified at {DB_FILE}")
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        try:
+            version = apply_migrations(conn)
+        finally:
+            conn.close()
+        logging.info(f"Database created/verified at {db_file} (schema v{version})")
     except sqlite3.Error as e:
         logging.error(f"Database creation error: {e}")
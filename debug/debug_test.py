@@ -2,11 +2,12 @@
 import logging
 import os
 
-from db.hash_db import load_hashes_from_db
+from db.hash_db import get_hash_store
+from db.hash_index import HashIndex
 from debug_logger import configure_debug_logging
 from detection.change_detector import detect_changes
 from scanning.scan_manager import scan_directory_and_collect_stats, should_skip_file
-from scanning.file_scanner import scan_directory_with_parallelism
+from scanning.file_scanner import scan_directory
 
 
 def run_test_scan(directory):
@@ -16,17 +17,16 @@ def run_test_scan(directory):
 
     logging.debug(f"Starting test scan for directory: {directory}")
 
-    # Load file hashes
-    try:
-        stored_hashes = load_hashes_from_db("file_hashes.db")
-        logging.debug(f"Loaded hashes: {len(stored_hashes)} hashes found.")
-    except Exception as e:
-        logging.error(f"Error loading hashes: {e}")
+    # Look up stored hashes one directory at a time
+    stored_hashes = HashIndex(get_hash_store("file_hashes.db"))
 
     # Start scanning directory
     try:
-        changes, current_file_hashes = detect_changes(
-            directory, stored_hashes, scan_directory_with_parallelism
+        changes, current_file_hashes, _ = detect_changes(
+            directory,
+            stored_hashes,
+            scan_directory,
+            stored_signatures=stored_hashes.signatures,
         )
         logging.debug(f"Detected {len(current_file_hashes)} files in directory.")
         logging.debug(f"Detected {len(changes)} changes.")
@@ -1,24 +1,219 @@
 #!/usr/bin/env python3
 
-from hashing.hash_computer import compute_file_hash
+import time
+from collections import namedtuple
+from hashing.hash_computer import HashEngine
+from hashing.quick_hash import QUICK_HASH_SAMPLE_SIZE
+from metrics.scan_metrics import ScanMetrics
 
+# Files modified this close to the scan may change again within the same
+# timestamp tick, so their signature is not trusted on the next run.
+RACY_WINDOW_NS = 2_000_000_000
 
-def detect_changes(directory, stored_hashes, scan_directory_func):
-    """Detect changes in the directory by comparing file hashes."""
+# What to store for a file besides its hash. chunks is a (hashed_size,
+# digests) pair for append-aware hashes, None to keep the stored chunk list.
+FileRecord = namedtuple(
+    "FileRecord",
+    ["mtime", "signature", "algorithm", "quick_hash", "verified_at", "chunks"],
+)
+
+
+def build_record(
+    signature, scan_start_ns, algorithm, quick_hash=None, verified_at=None, chunks=None
+):
+    """Return the FileRecord to store for a file hashed on this run."""
+    mtime = signature[1] / 1e9
+    if signature[1] >= scan_start_ns - RACY_WINDOW_NS:
+        # Racily clean: drop mtime_ns so the file is rehashed on the next run
+        signature = (signature[0], None) + signature[2:]
+    return FileRecord(mtime, signature, algorithm, quick_hash, verified_at, chunks)
+
+
+def detect_changes(
+    directory,
+    stored_hashes,
+    scan_directory_func,
+    stored_signatures=None,
+    paranoid=False,
+    hash_engine=None,
+    stored_algorithms=None,
+    stored_quick_hashes=None,
+    stored_chunks=None,
+    skip_callback=None,
+    metrics=None,
+):
+    """
+    Detect changes in the directory by comparing file hashes.
+    scan_directory_func(directory) yields (file_path, signature) pairs,
+    grouped by directory.
+    stored_hashes and the other stored_* mappings only need get, [] and in,
+    so they can be views of a HashIndex.
+    Files whose stat signature matches the stored one keep their stored hash
+    without being read, unless paranoid is set. The remaining files are
+    hashed by the hash engine.
+    stored_algorithms maps stored rows to their algorithm tag; rows missing
+    from it were hashed with the engine's algorithm. Hashes with different
+    tags cannot be compared, so those files count as changed only when their
+    signature moved. Rehashing them migrates the row to the current tag.
+    When the engine enables quick hashing, large files are first compared by
+    their quick hash (stored_quick_hashes maps paths to (quick_hash,
+    verified_at)). They get a full hash only if it differs or their periodic
+    verification is due, even when their stat signature is unchanged.
+    When the engine enables append-aware hashing, large files are hashed from
+    chunk digests, and files that only grew reuse their stored chunk digests
+    (stored_chunks maps paths to (hashed_size, digests)).
+    Files that cannot be read are passed to skip_callback(file_path, reason).
+    metrics receives the hashing time and counts the files kept on their
+    stat signature or quick hash, the files hashed and the bytes read.
+    :return: (changes, current_file_hashes, rehashed) where rehashed maps the
+    files whose stored record is outdated to the FileRecord to store
+    """
     changes = []
     current_file_hashes = {}
+    rehashed = {}
+    stored_signatures = stored_signatures or {}
+    stored_algorithms = stored_algorithms or {}
+    stored_quick_hashes = stored_quick_hashes or {}
+    stored_chunks = stored_chunks or {}
+    hash_engine = hash_engine or HashEngine()
+    skip_callback = skip_callback or (lambda file_path, reason: None)
+    metrics = metrics or ScanMetrics()
+    scan_start_ns = time.time_ns()
+    now = scan_start_ns / 1e9
 
-    # Scan the directory and compute hashes
-    files_metadata = scan_directory_func(directory)
-    for file_path, mtime in files_metadata:
-        file_hash = compute_file_hash(file_path)
-        if file_hash is None:
+    # Scan the directory and keep the files whose signature moved. Files come
+    # directory by directory, so lazily loaded stored rows are reused.
+    to_hash = {}
+    for file_path, signature in scan_directory_func(directory):
+        stored_hash = stored_hashes.get(file_path)
+        quick_record = stored_quick_hashes.get(file_path)
+
+        # Fast path: an unchanged stat signature proves the content is unchanged,
+        # unless the stored hash was only confirmed by a quick hash and is due
+        # for verification
+        if (
+            not paranoid
+            and stored_hash is not None
+            and stored_signatures.get(file_path) == signature
+            and not (
+                quick_record and hash_engine.verification_due(quick_record[1], now)
+            )
+        ):
+            current_file_hashes[file_path] = stored_hash
+            metrics.increment("files_unchanged")
+            continue
+
+        to_hash[file_path] = signature
+
+    # Pre-filter large files with their quick hash
+    quick_hashes = {}
+    quick_requests = [
+        (file_path, signature[0])
+        for file_path, signature in to_hash.items()
+        if hash_engine.uses_quick_hash(signature[0])
+    ]
+    quick_results = hash_engine.quick_hash_files(quick_requests)
+    for file_path, quick_hash in metrics.timed(quick_results, "hash"):
+        metrics.increment("files_quick_hashed")
+        metrics.increment("bytes_hashed", QUICK_HASH_SAMPLE_SIZE)
+        if quick_hash is None:
+            skip_callback(file_path, "Quick hash could not be computed")
+            to_hash.pop(file_path)
             continue
 
+        quick_hashes[file_path] = quick_hash
+        stored_quick_hash, verified_at = stored_quick_hashes.get(
+            file_path, (None, None)
+        )
+        if (
+            not paranoid
+            and quick_hash == stored_quick_hash
+            and file_path in stored_hashes
+            and not hash_engine.verification_due(verified_at, now)
+        ):
+            signature = to_hash.pop(file_path)
+            current_file_hashes[file_path] = stored_hashes[file_path]
+            metrics.increment("files_quick_matched")
+            rehashed[file_path] = build_record(
+                signature,
+                scan_start_ns,
+                stored_algorithms.get(file_path, hash_engine.algorithm),
+                quick_hash,
+                verified_at,
+            )
+
+    def record_hash(file_path, file_hash, algorithm, chunks=None):
+        """Compare a freshly computed hash with the stored one."""
+        signature = to_hash[file_path]
+        stored_hash = stored_hashes.get(file_path)
+        signature_matches = stored_signatures.get(file_path) == signature
+        if stored_algorithms.get(file_path, hash_engine.algorithm) == algorithm:
+            changed = stored_hash != file_hash
+        else:
+            changed = not signature_matches
+
         current_file_hashes[file_path] = file_hash
+        quick_hash = quick_hashes.get(file_path)
+        if file_hash != stored_hash or not signature_matches or quick_hash or chunks:
+            rehashed[file_path] = build_record(
+                signature,
+                scan_start_ns,
+                algorithm,
+                quick_hash,
+                now if quick_hash else None,
+                chunks,
+            )
 
-        # Check if the file hash has changed
-        if stored_hashes.get(file_path) != file_hash:
+        # Check if the file content has changed
+        if changed:
             changes.append(file_path)
 
-    return changes, current_file_hashes
+    # Hash large files from their chunk digests, reusing the stored prefix
+    append_requests = []
+    for file_path, signature in to_hash.items():
+        if not hash_engine.uses_append_hash(signature[0]):
+            continue
+        stored_size, stored_digests = None, None
+        stored_signature = stored_signatures.get(file_path)
+        if (
+            not paranoid
+            and file_path in stored_chunks
+            and stored_algorithms.get(file_path) == hash_engine.chunked_algorithm
+            and stored_signature is not None
+            and stored_signature[2] == signature[2]
+        ):
+            stored_size, stored_digests = stored_chunks[file_path]
+        append_requests.append((file_path, signature[0], stored_size, stored_digests))
+
+    append_results = hash_engine.append_hash_files(append_requests)
+    for file_path, result in metrics.timed(append_results, "hash"):
+        metrics.increment("files_hashed")
+        if result is None:
+            skip_callback(file_path, "Hash could not be computed")
+        else:
+            file_hash, digests, hashed_size, bytes_read = result
+            # Only the verified chunks and the appended bytes when the prefix matches
+            metrics.increment("bytes_hashed", bytes_read)
+            record_hash(
+                file_path,
+                file_hash,
+                hash_engine.chunked_algorithm,
+                (hashed_size, digests),
+            )
+
+    # Compute the full hashes of the remaining files
+    hash_requests = [
+        (file_path, signature[0])
+        for file_path, signature in to_hash.items()
+        if not hash_engine.uses_append_hash(signature[0])
+    ]
+    metrics.increment("bytes_hashed", sum(size for _, size in hash_requests))
+    hash_results = hash_engine.hash_files(hash_requests)
+    for file_path, file_hash in metrics.timed(hash_results, "hash"):
+        metrics.increment("files_hashed")
+        if file_hash is None:
+            skip_callback(file_path, "Hash could not be computed")
+        else:
+            record_hash(file_path, file_hash, hash_engine.algorithm)
+
+    return changes, current_file_hashes, rehashed
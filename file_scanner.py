@@ -2,21 +2,18 @@
 
 import os
 from tqdm import tqdm
+from scanning.file_scanner import walk_directory
 
 def scan_directory(directory):
     """Scan the directory and return file paths and metadata."""
     files_metadata = []
 
-    # Traverse the directory structure
-    total_files = sum([len(files) for _, _, files in os.walk(directory)])
-    with tqdm(total=total_files, desc="Scanning files") as pbar:
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if not file.startswith('.'):
-                    file_path = os.path.join(root, file)
-                    mtime = os.path.getmtime(file_path)
-                    files_metadata.append((file_path, mtime))
-                    pbar.update(1)
+    # Traverse the directory structure once; the total is not known upfront
+    with tqdm(desc="Scanning files", unit="files") as pbar:
+        for root, files in walk_directory(directory):
+            for file, signature in files:
+                files_metadata.append((os.path.join(root, file), signature[1] / 1e9))
+            pbar.update(len(files))
 
     return files_metadata
 
@@ -1,16 +1,38 @@
 #!/usr/bin/env python3
 
 import argparse
-import logging
+import contextlib
 import os
-<<<<<<< HEAD
-import argparse
 import time
 from logs.event_logger import log_event
+from db.hash_store import DEFAULT_BATCH_SIZE, HashStore
 from db.schema_manager import create_database
+from hashing.algorithms import DEFAULT_ALGORITHM, HASH_ALGORITHMS
+from hashing.hash_computer import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_MMAP_THRESHOLD,
+    DEFAULT_VERIFY_INTERVAL,
+    HashEngine,
+)
 from logs.log_config import configure_logging
+from output.readme_writer import (
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_README_WORKERS,
+    OVERFLOW_MODES,
+    ReadmeWriter,
+)
 from output.terminal_output import display_scan_statistics
+from metrics.profiling import StageProfiler, default_run_directory
+from scanning.ignore_rules import IGNORE_FILENAMES, IgnoreRules
 from scanning.scan_manager import scan_directory_and_collect_stats
+from scanning.sharding import (
+    SHARD_STRATEGIES,
+    merge_shards,
+    plan_shard,
+    shard_db_path,
+    shard_spec,
+)
+from watching.watch_manager import DEFAULT_DEBOUNCE, watch_directory
 
 
 def main():
@@ -24,6 +46,168 @@ def main():
         help="Root directory path. Defaults to the current working directory.",
         default=os.getcwd(),
     )
+    parser.add_argument(
+        "--paranoid",
+        action="store_true",
+        help="Rehash every file instead of trusting unchanged size, mtime, inode and ctime.",
+    )
+    parser.add_argument(
+        "--ignore",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Ignore paths matching this .gitignore-style pattern, relative to the root path, on top of the .gitignore and .readmeignore files. Can be repeated.",
+    )
+    parser.add_argument(
+        "--no-ignore-files",
+        action="store_true",
+        help="Do not read the .gitignore and .readmeignore files; only --ignore patterns and hidden files are skipped.",
+    )
+    parser.add_argument(
+        "--scan-workers",
+        type=int,
+        default=1,
+        help="Directories listed concurrently while scanning, for high-latency filesystems such as NFS. Defaults to 1 (sequential).",
+    )
+    parser.add_argument(
+        "--trust-directory-signatures",
+        action="store_true",
+        help="Reuse the stored file list of directories whose size, mtime, inode and ctime are unchanged, without listing them or stat'ing their files. In-place edits of existing files in such directories are not detected.",
+    )
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        help="Number of parallel hashing workers. 1 disables the pool. Defaults to a value based on the CPU count.",
+    )
+    parser.add_argument(
+        "--hash-executor",
+        choices=sorted(HashEngine.EXECUTORS),
+        default="thread",
+        help="Run hashing workers as threads or processes. Defaults to threads.",
+    )
+    parser.add_argument(
+        "--hash-algorithm",
+        choices=sorted(HASH_ALGORITHMS),
+        default=DEFAULT_ALGORITHM,
+        help=f"Digest used for new hashes. Rows stored with another digest are migrated as their files get rehashed. Defaults to {DEFAULT_ALGORITHM}.",
+    )
+    parser.add_argument(
+        "--hash-block-size",
+        type=int,
+        default=DEFAULT_BLOCK_SIZE,
+        help=f"Bytes read per call while hashing. Defaults to {DEFAULT_BLOCK_SIZE}.",
+    )
+    parser.add_argument(
+        "--mmap-threshold",
+        type=int,
+        default=DEFAULT_MMAP_THRESHOLD,
+        help=f"Hash files of at least this many bytes through mmap. 0 disables mmap. Defaults to {DEFAULT_MMAP_THRESHOLD}.",
+    )
+    parser.add_argument(
+        "--quick-hash-min-size",
+        type=int,
+        help="Pre-filter files of at least this many bytes with a quick hash of their size and head, middle and tail blocks. Disabled by default.",
+    )
+    parser.add_argument(
+        "--verify-interval",
+        type=float,
+        default=DEFAULT_VERIFY_INTERVAL / 86400,
+        help="Days after which a quick-hashed file gets a full hash again. Defaults to 30.",
+    )
+    parser.add_argument(
+        "--append-hash-min-size",
+        type=int,
+        help="Hash files of at least this many bytes from stored chunk digests, so a file that only grew is hashed by reading its new tail. Disabled by default.",
+    )
+    parser.add_argument(
+        "--db-batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Rows buffered before they are written to the database in one transaction. Defaults to {DEFAULT_BATCH_SIZE}.",
+    )
+    parser.add_argument(
+        "--readme-workers",
+        type=int,
+        default=DEFAULT_README_WORKERS,
+        help=f"Threads writing changed README files. 1 writes them one by one. Defaults to {DEFAULT_README_WORKERS}.",
+    )
+    parser.add_argument(
+        "--readme-max-entries",
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        help=f"Entries listed per README page. 0 lists every entry on one page. Defaults to {DEFAULT_MAX_ENTRIES}.",
+    )
+    parser.add_argument(
+        "--readme-overflow",
+        choices=OVERFLOW_MODES,
+        default="paginate",
+        help="Split directories with more entries than --readme-max-entries into README-2.md, README-3.md, ... continuation pages (paginate), or list the first entries and count the rest (summary). Defaults to paginate.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the scan, keep running and update READMEs as files change, using inotify. Linux only.",
+    )
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        help=f"Seconds without events before a batch of changes is processed in watch mode. Defaults to {DEFAULT_DEBOUNCE}.",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        help="Write a JSON report of the stage timers, counters and latency histograms of the run to this file.",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        help="Write the run metrics in the Prometheus text format to this file, e.g. in the node-exporter textfile collector directory.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the last interrupted scan of the path from its checkpoint, skipping the directories it already finished. Starts a new scan if there is none.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=shard_spec,
+        metavar="I/N",
+        help="Scan only shard I of N (counted from 1) into a database of its own, without rendering READMEs. The top-level directories are split between the shards; the first one also takes the files directly in the path. Merge the shard databases with the merge command.",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=SHARD_STRATEGIES,
+        default="hash",
+        help="Assign top-level directories to shards by the hash of their name, or by balancing their size stored by the previous run (default hash).",
+    )
+    parser.add_argument(
+        "--shard-db",
+        help="Database of the shard scanned with --shard. Defaults to file_hashes.shard-I-of-N.db.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile each stage of the scan with cProfile and write a pstats dump and a text report per stage into the run directory.",
+    )
+    parser.add_argument(
+        "--trace-alloc",
+        action="store_true",
+        help="Trace memory allocations with tracemalloc and write the top allocation sites of each stage of the scan into the run directory.",
+    )
+    parser.add_argument(
+        "--run-dir",
+        help="Directory for the --profile and --trace-alloc artifacts. Defaults to runs/run-<date>-<time>.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="Merge shard databases into the main database and render the READMEs of the changed directories.",
+    )
+    merge_parser.add_argument(
+        "shard_dbs",
+        nargs="+",
+        metavar="SHARD_DB",
+        help="Shard databases written with --shard.",
+    )
     args = parser.parse_args()
     root_path = args.path
 
@@ -40,11 +224,103 @@ def main():
     # Create or verify the database schema
     create_database()
 
-    # Start the scan
-    metrics, total_files, skipped_files, readmes_created, readmes_updated, changes = (
-        scan_directory_and_collect_stats(root_path)
+    hash_engine = HashEngine(
+        args.hash_workers,
+        args.hash_executor,
+        args.hash_algorithm,
+        args.hash_block_size,
+        args.mmap_threshold,
+        args.quick_hash_min_size,
+        args.verify_interval * 86400,
+        args.append_hash_min_size,
+    )
+    readme_writer = ReadmeWriter(
+        args.readme_workers, args.readme_max_entries, args.readme_overflow
+    )
+    ignore_rules = IgnoreRules(
+        root_path, args.ignore, () if args.no_ignore_files else IGNORE_FILENAMES
     )
 
+    if args.command == "merge":
+        with HashStore(db_path, args.db_batch_size) as hash_store:
+            merged, changes, readmes_created, readmes_updated = merge_shards(
+                root_path, args.shard_dbs, hash_store, readme_writer, ignore_rules
+            )
+        print(
+            f"Merged {merged} of {len(args.shard_dbs)} shard databases: "
+            f"{len(changes)} changes, {readmes_created} READMEs created, "
+            f"{readmes_updated} updated"
+        )
+        log_event("INFO", "Merge completed")
+        return
+
+    if args.watch:
+        with HashStore(db_path, args.db_batch_size) as hash_store:
+            try:
+                watch_directory(
+                    root_path,
+                    hash_engine,
+                    hash_store,
+                    args.watch_debounce,
+                    args.scan_workers,
+                    readme_writer,
+                    ignore_rules,
+                )
+            except KeyboardInterrupt:
+                log_event("INFO", "Watch stopped")
+        return
+
+    # Profile the stages of the scan, if requested
+    profiler = None
+    if args.profile or args.trace_alloc:
+        profiler = StageProfiler(
+            args.run_dir or default_run_directory(), args.profile, args.trace_alloc
+        )
+
+    # A shard scans its part of the tree into its own database
+    shard = None
+    scan_db_path = db_path
+    if args.shard:
+        index, count = args.shard
+        if args.shard_by == "size":
+            with HashStore(db_path, args.db_batch_size) as hash_store:
+                shard = plan_shard(root_path, index, count, "size", hash_store)
+        else:
+            shard = plan_shard(root_path, index, count)
+        scan_db_path = args.shard_db or shard_db_path(db_path, index, count)
+        print(f"Shard {index + 1} of {count} database: {scan_db_path}")
+
+    # Start the scan, writing to the database through a single connection
+    with HashStore(scan_db_path, args.db_batch_size) as hash_store, (
+        profiler or contextlib.nullcontext()
+    ):
+        # Start shards from the main database, unless resuming one
+        if shard is not None and not (
+            args.resume and hash_store.find_interrupted_run(shard.root) is not None
+        ):
+            hash_store.seed_shard(db_path, shard.scopes())
+        (
+            metrics,
+            total_files,
+            skipped_files,
+            readmes_created,
+            readmes_updated,
+            changes,
+        ) = scan_directory_and_collect_stats(
+            root_path,
+            paranoid=args.paranoid,
+            hash_engine=hash_engine,
+            hash_store=hash_store,
+            scan_workers=args.scan_workers,
+            trust_directory_signatures=args.trust_directory_signatures,
+            readme_writer=readme_writer,
+            profiler=profiler,
+            resume=args.resume,
+            shard=shard,
+            render_readmes=shard is None,
+            ignore_rules=ignore_rules,
+        )
+
     # Stop the overall execution timer
     overall_end_time = time.time()
     total_time = overall_end_time - overall_start_time
@@ -59,6 +335,15 @@ def main():
         total_time,
     )
 
+    # Export the run metrics
+    try:
+        metrics.write_reports(args.metrics_json, args.metrics_prom)
+    except OSError as e:
+        log_event("ERROR", f"Failed to write the metrics reports: {e}")
+
+    if profiler is not None:
+        print(f"\nProfiling artifacts written to {profiler.run_directory}")
+
     # Log the completion of the scan
     log_event("INFO", "Scan completed")
 
@@ -66,124 +351,5 @@ def main():
     print(f"\nThe terminal reports an execution time of {total_time:.3f} seconds.")
 
 
-=======
-import sqlite3
-
-# Import necessary modules
-from datetime import datetime
-from readme_writer import write_readme
-
-# Importing from refactored modules
-from file_scanner import scan_directory
-from hash_manager import compute_file_hash, save_file_hash
-from logger import log_skipped_file, report_skipped_files
-from make_db import DB_FILE, create_database
-
-print(f"Database path being used: {DB_FILE}")
-
-
-def load_hashes_from_db(db_file):
-    """Load hashes from the database."""
-    hashes = {}
-    try:
-        with sqlite3.connect(db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT file_path, hash FROM file_hashes")
-            for row in cursor.fetchall():
-                hashes[row[0]] = row[1]
-    except sqlite3.Error as e:
-        logging.error(f"Failed to load hashes from database: {e}")
-    return hashes
-
-
-def remove_last_update_line(content):
-    """Remove the line containing the 'Last update' information."""
-    return [line for line in content if not line.startswith(">There are")]
-
-
-def detect_changes(directory, stored_hashes):
-    """Detect changes in the directory by comparing file hashes."""
-    changes = []
-    current_file_hashes = {}
-
-    # Scan the directory and compute hashes
-    files_metadata = scan_directory(directory)
-    for file_path, mtime in files_metadata:
-        file_hash = compute_file_hash(file_path)
-        if file_hash is None:
-            logging.error(f"Hash for {file_path} could not be computed")
-            continue
-
-        if file_hash:
-            current_file_hashes[file_path] = file_hash
-
-            # Check if the file hash has changed
-            if stored_hashes.get(file_path) != file_hash:
-                changes.append(file_path)
-
-            # Save file hash to the database
-            try:
-                logging.info(f"Attempting to save hash for {file_path} with hash {file_hash} and mtime {mtime}")
-                save_file_hash(DB_FILE, file_path, file_hash, mtime)
-                logging.info(f"Successfully saved hash for {file_path}")
-            except Exception as e:
-                logging.error(f"Failed to save hash for {file_path}: {e}")
-
-    return changes, current_file_hashes
-
-
-def write_readme_files(directory):
-    """Write README.md files for the directory and its subdirectories."""
-    try:
-        old_file_hashes = load_hashes_from_db(DB_FILE)
-        changes, current_file_hashes = detect_changes(directory, old_file_hashes)
-
-        if changes:
-            logging.info(f"Detected changes in {len(changes)} files.")
-
-            # List subdirectories and files
-            subdirs = [d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))]
-            files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-
-            # Write the README
-            date_str = datetime.now().strftime("%Y-%m-%d")
-            write_readme(directory, files, subdirs, date_str)
-
-            # Save updated hashes
-            # No need to save hashes separately, they are already stored in the database
-        else:
-            logging.info(f"No changes detected for {directory}.")
-
-    except Exception as e:
-        logging.error(f"Error in write_readme_files: {e}")
-
-
-def main():
-    parser = argparse.ArgumentParser(description="Generate README files for a directory and its subdirectories.")
-    parser.add_argument("-p", "--path", help="Root directory path. Defaults to the current working directory.",
-                        default=os.getcwd())
-    args = parser.parse_args()
-
-    root_path = args.path
-
-    try:
-        # Create or update the hash database (if relevant)
-        create_database()
-        logging.info(f"Database created/verified at {DB_FILE}")
-
-        # Add a test entry to the skipped_files table
-        log_skipped_file(DB_FILE, "test_file.txt", "Test reason for skipping")
-
-        # Continue with the rest of your script...
-        write_readme_files(root_path)
-
-        # Ensure skipped files are written to a log file
-        report_skipped_files(DB_FILE, root_path)
-
-    except Exception as e:
-        logging.error(f"Error in main execution: {e}")
-
-
->>>>>>> 091ee6e (chore(files): Update files)
 if __name__ == "__main__":
     main()
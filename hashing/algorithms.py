@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import functools
+import hashlib
+
+# md5 stays the default so existing databases do not need a migration
+DEFAULT_ALGORITHM = "md5"
+
+# Registry of digest name -> hash object factory
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s-128": functools.partial(hashlib.blake2s, digest_size=16),
+}
+
+
+def register_algorithm(name, factory):
+    """Register a hash object factory under a digest name."""
+    HASH_ALGORITHMS[name] = factory
+
+
+def new_hasher(algorithm=DEFAULT_ALGORITHM):
+    """Return a new hash object for a registered digest name."""
+    try:
+        factory = HASH_ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown hash algorithm: {algorithm}") from None
+    return factory()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+from hashing.algorithms import DEFAULT_ALGORITHM, new_hasher
+from hashing.file_reader import DEFAULT_BLOCK_SIZE, advise, hash_range
+
+# Size of the chunks whose digests are stored for append-aware hashing.
+# Changing it invalidates every stored chunk list.
+APPEND_CHUNK_SIZE = 1024 * 1024
+
+
+def chunked_algorithm(algorithm):
+    """Return the tag of hashes built from the chunk digests of a digest name."""
+    return f"{algorithm}-chunked"
+
+
+def digest_range(f, algorithm, offset, length, block_size):
+    """
+    Digest up to length bytes of a file starting at offset.
+    :return: (digest, bytes_read)
+    """
+    hash_obj = new_hasher(algorithm)
+    bytes_read = hash_range(f, hash_obj, offset, length, block_size)
+    return hash_obj.digest(), bytes_read
+
+
+def digest_chunks(f, algorithm, offset, block_size, chunk_size=APPEND_CHUNK_SIZE):
+    """
+    Digest a file from offset to its end in chunk_size pieces.
+    :return: (digests, end) with one binary digest per chunk, the last one
+    possibly partial, and the offset the reading stopped at
+    """
+    digests = []
+    while True:
+        digest, size = digest_range(f, algorithm, offset, chunk_size, block_size)
+        if not size:
+            break
+        digests.append(digest)
+        offset += size
+        if size < chunk_size:
+            break
+    return digests, offset
+
+
+def split_digests(joined, algorithm):
+    """Split concatenated binary chunk digests back into a list."""
+    digest_size = new_hasher(algorithm).digest_size
+    return [joined[i : i + digest_size] for i in range(0, len(joined), digest_size)]
+
+
+def hash_appended(
+    f, algorithm, block_size, stored_size, digests, chunk_size, bytes_read
+):
+    """
+    Verify the first and last stored chunks of a grown file, then digest the
+    rest of the last chunk and the chunks appended after it.
+    :param bytes_read: One-item list the number of bytes read is added to
+    :return: (digests, hashed_size), or None if a stored chunk does not verify
+    """
+    last = len(digests) - 1
+    if last > 0:
+        digest, size = digest_range(f, algorithm, 0, chunk_size, block_size)
+        bytes_read[0] += size
+        if (digest, size) != (digests[0], chunk_size):
+            return None
+
+    offset = last * chunk_size
+    length = stored_size - offset
+    hash_obj = new_hasher(algorithm)
+    size = hash_range(f, hash_obj, offset, length, block_size)
+    bytes_read[0] += size
+    if size != length or hash_obj.copy().digest() != digests[last]:
+        return None
+    # Complete the last chunk with the appended bytes, without reading it again
+    size = hash_range(f, hash_obj, stored_size, chunk_size - length, block_size)
+    bytes_read[0] += size
+    new_digests = [hash_obj.digest()]
+    hashed_size = stored_size + size
+    if length + size == chunk_size:
+        more, end = digest_chunks(f, algorithm, hashed_size, block_size, chunk_size)
+        bytes_read[0] += end - hashed_size
+        new_digests += more
+        hashed_size = end
+    return digests[:last] + new_digests, hashed_size
+
+
+def compute_append_hash(
+    file_path,
+    algorithm=DEFAULT_ALGORITHM,
+    block_size=DEFAULT_BLOCK_SIZE,
+    stored_size=None,
+    stored_digests=None,
+    chunk_size=APPEND_CHUNK_SIZE,
+):
+    """
+    Hash a file as the digest of its chunk digests.
+    When the file grew past stored_size and its first and last stored chunks
+    still verify, only the first and last stored chunks and the appended
+    bytes are read. The hash state of the verified last chunk is carried on
+    with the appended bytes, so that chunk is read once.
+    An in-place edit between those two chunks is not noticed by this path;
+    a paranoid run rereads the whole file.
+    :return: (file_hash, digests, hashed_size, bytes_read) with digests the
+    concatenated binary chunk digests and bytes_read the bytes actually read,
+    verification included, or None if the file cannot be read
+    """
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            fd = f.fileno()
+            advise(fd, getattr(os, "POSIX_FADV_SEQUENTIAL", 0))
+            digests = split_digests(stored_digests or b"", algorithm)
+            appended = None
+            bytes_read = [0]
+            if (
+                digests
+                and (len(digests) - 1) * chunk_size < stored_size
+                and stored_size <= len(digests) * chunk_size
+                and os.fstat(fd).st_size > stored_size
+            ):
+                appended = hash_appended(
+                    f,
+                    algorithm,
+                    block_size,
+                    stored_size,
+                    digests,
+                    chunk_size,
+                    bytes_read,
+                )
+            if appended is None:
+                digests, hashed_size = digest_chunks(
+                    f, algorithm, 0, block_size, chunk_size
+                )
+                bytes_read[0] += hashed_size
+            else:
+                digests, hashed_size = appended
+            advise(fd, getattr(os, "POSIX_FADV_DONTNEED", 0))
+    except OSError as e:
+        logging.error(f"Error reading file {file_path}: {e}")
+        return None
+
+    joined = b"".join(digests)
+    hash_obj = new_hasher(algorithm)
+    hash_obj.update(joined)
+    return hash_obj.hexdigest(), joined, hashed_size, bytes_read[0]
+
+
+def append_hash_file_batch(
+    items, algorithm=DEFAULT_ALGORITHM, block_size=DEFAULT_BLOCK_SIZE
+):
+    """Hash a batch of (file_path, stored_size, stored_digests) in one worker task."""
+    return [
+        (
+            file_path,
+            compute_append_hash(
+                file_path, algorithm, block_size, stored_size, stored_digests
+            ),
+        )
+        for file_path, stored_size, stored_digests in items
+    ]
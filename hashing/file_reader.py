@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import threading
+
+# Read size for the reused read buffer and for each update on mapped files
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+_read_buffers = threading.local()
+
+
+def get_read_buffer(block_size):
+    """Return this thread's reusable read buffer, sized to block_size."""
+    buffer = getattr(_read_buffers, "buffer", None)
+    if buffer is None or len(buffer) != block_size:
+        buffer = bytearray(block_size)
+        _read_buffers.buffer = buffer
+    return buffer
+
+
+def advise(fd, advice, offset=0, length=0):
+    """Pass an access pattern hint to the kernel where posix_fadvise exists."""
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass  # Hints are optional, e.g. unsupported on some filesystems
+
+
+def update_from_file(hash_obj, f, block_size):
+    """Feed a file to a hash object through a reused buffer without copies."""
+    buffer = get_read_buffer(block_size)
+    with memoryview(buffer) as view:
+        while size := f.readinto(buffer):
+            hash_obj.update(view[:size])
+
+
+def hash_range(f, hash_obj, offset, length, block_size):
+    """
+    Feed up to length bytes of a file starting at offset to a hash object.
+    :return: The number of bytes read
+    """
+    buffer = get_read_buffer(block_size)
+    bytes_read = 0
+    f.seek(offset)
+    with memoryview(buffer) as view:
+        while bytes_read < length:
+            size = f.readinto(view[: min(block_size, length - bytes_read)])
+            if not size:
+                break
+            hash_obj.update(view[:size])
+            bytes_read += size
+    return bytes_read
+
+
+def update_from_mmap(hash_obj, fd, block_size):
+    """Feed a memory-mapped file to a hash object block by block."""
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, "madvise"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            for offset in range(0, len(mapped), block_size):
+                hash_obj.update(view[offset : offset + block_size])
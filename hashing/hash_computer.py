@@ -1,12 +1,217 @@
 #!/usr/bin/env python3
 
-import hashlib
+import concurrent.futures
+import logging
+import os
+from hashing.algorithms import DEFAULT_ALGORITHM, new_hasher
+from hashing.chunk_hash import append_hash_file_batch, chunked_algorithm
+from hashing.file_reader import (
+    DEFAULT_BLOCK_SIZE,
+    advise,
+    update_from_file,
+    update_from_mmap,
+)
+from hashing.quick_hash import QUICK_HASH_SAMPLE_SIZE, quick_hash_file_batch
 
+# Files at least this large are hashed through mmap; 0 disables mmap
+DEFAULT_MMAP_THRESHOLD = 64 * 1024 * 1024
+# Seconds after which a file accepted on its quick hash gets a full hash again
+DEFAULT_VERIFY_INTERVAL = 30 * 24 * 60 * 60
 
-def compute_file_hash(file_path):
-    """Compute the hash for a file."""
-    hash_obj = hashlib.md5()
-    with open(file_path, "rb") as f:
-        while chunk := f.read(4096):
-            hash_obj.update(chunk)
+# Files below this size are grouped into batches so a single worker task
+# hashes many of them, instead of paying the per-future overhead per file.
+SMALL_FILE_SIZE = 1024 * 1024
+BATCH_BYTES = 16 * 1024 * 1024
+BATCH_FILES = 256
+
+
+def compute_file_hash(
+    file_path,
+    algorithm=DEFAULT_ALGORITHM,
+    block_size=DEFAULT_BLOCK_SIZE,
+    mmap_threshold=DEFAULT_MMAP_THRESHOLD,
+):
+    """
+    Compute the hash for a file, or return None if it cannot be read.
+    Files are read sequentially and dropped from the page cache afterwards,
+    so a scan does not evict the working set of other programs.
+    """
+    hash_obj = new_hasher(algorithm)
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            fd = f.fileno()
+            advise(fd, getattr(os, "POSIX_FADV_SEQUENTIAL", 0))
+            if mmap_threshold and os.fstat(fd).st_size >= mmap_threshold:
+                update_from_mmap(hash_obj, fd, block_size)
+            else:
+                update_from_file(hash_obj, f, block_size)
+            advise(fd, getattr(os, "POSIX_FADV_DONTNEED", 0))
+    except (OSError, ValueError) as e:
+        logging.error(f"Error reading file {file_path}: {e}")
+        return None
     return hash_obj.hexdigest()
+
+
+def hash_file_batch(
+    file_paths,
+    algorithm=DEFAULT_ALGORITHM,
+    block_size=DEFAULT_BLOCK_SIZE,
+    mmap_threshold=DEFAULT_MMAP_THRESHOLD,
+):
+    """Hash a batch of files inside one worker task."""
+    return [
+        (file_path, compute_file_hash(file_path, algorithm, block_size, mmap_threshold))
+        for file_path in file_paths
+    ]
+
+
+class HashEngine:
+    """Hash files on a bounded thread or process pool."""
+
+    EXECUTORS = {
+        "thread": concurrent.futures.ThreadPoolExecutor,
+        "process": concurrent.futures.ProcessPoolExecutor,
+    }
+
+    def __init__(
+        self,
+        workers=None,
+        executor="thread",
+        algorithm=DEFAULT_ALGORITHM,
+        block_size=DEFAULT_BLOCK_SIZE,
+        mmap_threshold=DEFAULT_MMAP_THRESHOLD,
+        quick_hash_min_size=None,
+        verify_interval=DEFAULT_VERIFY_INTERVAL,
+        append_hash_min_size=None,
+    ):
+        """
+        :param workers: Number of hashing workers. 1 hashes inline without a pool,
+        None picks a default suited to the executor type.
+        :param executor: "thread" or "process"
+        :param algorithm: Registered digest name from hashing.algorithms
+        :param block_size: Bytes read per call and per hash update
+        :param mmap_threshold: Files at least this large are memory-mapped, 0 disables it
+        :param quick_hash_min_size: Files at least this large are pre-filtered
+        with a quick hash, None disables quick hashing
+        :param verify_interval: Seconds after which a quick hash match no
+        longer spares a file from a full hash
+        :param append_hash_min_size: Files at least this large are hashed from
+        stored chunk digests so appends only read the new tail, None disables it
+        """
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"Unknown hash executor: {executor}")
+        new_hasher(algorithm)  # Fail early on unknown digest names
+        if workers is None:
+            cpu_count = os.cpu_count() or 1
+            # hashlib releases the GIL on large updates, so threads can
+            # keep several disks and cores busy
+            workers = min(32, cpu_count + 4) if executor == "thread" else cpu_count
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.algorithm = algorithm
+        self.block_size = block_size
+        self.mmap_threshold = mmap_threshold
+        self.quick_hash_min_size = quick_hash_min_size
+        self.verify_interval = verify_interval
+        self.append_hash_min_size = append_hash_min_size
+        self.chunked_algorithm = chunked_algorithm(algorithm)
+        # Bound the number of queued tasks so memory stays flat on huge trees
+        self.max_pending = self.workers * 2
+
+    def hash_options(self):
+        """Return the (algorithm, block_size, mmap_threshold) passed to workers."""
+        return self.algorithm, self.block_size, self.mmap_threshold
+
+    def uses_quick_hash(self, size):
+        """Check whether a file of this size is pre-filtered with a quick hash."""
+        return self.quick_hash_min_size is not None and size >= self.quick_hash_min_size
+
+    def uses_append_hash(self, size):
+        """Check whether a file of this size is hashed from chunk digests."""
+        return (
+            self.append_hash_min_size is not None and size >= self.append_hash_min_size
+        )
+
+    def verification_due(self, verified_at, now):
+        """Check whether a quick hash match still needs a full hash to confirm it."""
+        return verified_at is None or now - verified_at >= self.verify_interval
+
+    @staticmethod
+    def batch_files(files):
+        """
+        Group (item, size) pairs into lists of items to hash per task, where
+        an item is usually a file path. Large files get a task of their own.
+        """
+        batch = []
+        batch_bytes = 0
+        for item, size in files:
+            if size >= SMALL_FILE_SIZE:
+                yield [item]
+                continue
+            batch.append(item)
+            batch_bytes += size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                yield batch
+                batch = []
+                batch_bytes = 0
+        if batch:
+            yield batch
+
+    def hash_files(self, files):
+        """
+        Hash (file_path, size) pairs.
+        :return: Generator of (file_path, file_hash) pairs in completion order,
+        with file_hash None for unreadable files
+        """
+        return self.run_batches(
+            hash_file_batch, self.batch_files(files), self.hash_options()
+        )
+
+    def quick_hash_files(self, files):
+        """
+        Compute the quick hash of (file_path, size) pairs.
+        :return: Generator of (file_path, quick_hash) pairs in completion order
+        """
+        # A quick hash reads the same few blocks whatever the file size
+        samples = ((file_path, QUICK_HASH_SAMPLE_SIZE) for file_path, _ in files)
+        return self.run_batches(
+            quick_hash_file_batch, self.batch_files(samples), (self.algorithm,)
+        )
+
+    def append_hash_files(self, files):
+        """
+        Hash (file_path, size, stored_size, stored_digests) items from their
+        chunk digests, reading only the appended tail when possible.
+        :return: Generator of (file_path, (file_hash, digests, hashed_size,
+        bytes_read)) pairs in completion order, with None for unreadable files
+        """
+        items = (
+            ((file_path, stored_size, stored_digests), size)
+            for file_path, size, stored_size, stored_digests in files
+        )
+        return self.run_batches(
+            append_hash_file_batch,
+            self.batch_files(items),
+            (self.algorithm, self.block_size),
+        )
+
+    def run_batches(self, batch_func, batches, options):
+        """Run batch_func(batch, *options) on the pool and yield its results."""
+        if self.workers == 1:
+            for batch in batches:
+                yield from batch_func(batch, *options)
+            return
+
+        with self.EXECUTORS[self.executor](max_workers=self.workers) as executor:
+            pending = set()
+            for batch in batches:
+                if len(pending) >= self.max_pending:
+                    done, pending = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        yield from future.result()
+                pending.add(executor.submit(batch_func, batch, *options))
+
+            for future in concurrent.futures.as_completed(pending):
+                yield from future.result()
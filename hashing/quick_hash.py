@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+from hashing.algorithms import DEFAULT_ALGORITHM, new_hasher
+from hashing.file_reader import DEFAULT_BLOCK_SIZE, hash_range
+
+# Bytes read at each sampled offset
+QUICK_HASH_BLOCK_SIZE = 64 * 1024
+# Total bytes a fingerprint reads: head, middle and tail blocks
+QUICK_HASH_SAMPLE_SIZE = 3 * QUICK_HASH_BLOCK_SIZE
+
+
+def sample_offsets(size, block_size=QUICK_HASH_BLOCK_SIZE):
+    """Return the head, middle and tail block offsets for a file size."""
+    if size <= 3 * block_size:
+        return [0]  # The whole file fits in the samples
+    return [0, (size - block_size) // 2, size - block_size]
+
+
+def compute_quick_hash(
+    file_path, algorithm=DEFAULT_ALGORITHM, block_size=QUICK_HASH_BLOCK_SIZE
+):
+    """
+    Fingerprint a file from its size and a few fixed-offset blocks.
+    The fingerprint only proves a file changed; equal fingerprints do not
+    prove it is unchanged, which is why full hashes are still verified
+    periodically. Returns None if the file cannot be read.
+    """
+    hash_obj = new_hasher(algorithm)
+    try:
+        with open(file_path, "rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            hash_obj.update(size.to_bytes(8, "little"))
+            read_size = block_size if size > 3 * block_size else size
+            for offset in sample_offsets(size, block_size):
+                # Raw reads may come back short, so read until the block is full
+                hash_range(f, hash_obj, offset, read_size, DEFAULT_BLOCK_SIZE)
+    except OSError as e:
+        logging.error(f"Error reading file {file_path}: {e}")
+        return None
+    return hash_obj.hexdigest()
+
+
+def quick_hash_file_batch(file_paths, algorithm=DEFAULT_ALGORITHM):
+    """Fingerprint a batch of files inside one worker task."""
+    return [
+        (file_path, compute_quick_hash(file_path, algorithm))
+        for file_path in file_paths
+    ]
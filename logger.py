@@ -3,54 +3,54 @@
 import json
 import logging
 from logging.handlers import RotatingFileHandler
+from db.hash_db import get_hash_store
+from logs import skipped_file_logger
+from logs.log_config import configure_logging
 
 
-def setup_logging(log_file="script.log"):
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, for parsing and sorting."""
+
+    def format(self, record):
+        log_record = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            "filename": record.filename,
+            "funcName": record.funcName,
+            "lineno": record.lineno,
+        }
+        return json.dumps(log_record)
+
+
+def setup_logging(log_file="script.log", log_level=logging.DEBUG):
     """
     Set up logging configuration.
     Logs everything to a file, no terminal output.
     Logs are in structured JSON format for better parsing and sorting.
+    The file is written by the listener thread of configure_logging, so
+    callers do not wait on it. Nothing is installed on import.
     """
-
-    # Define a custom logging format with JSON structure
-    class JsonFormatter(logging.Formatter):
-        def format(self, record):
-            log_record = {
-                "time": self.formatTime(record, self.datefmt),
-                "level": record.levelname,
-                "message": record.getMessage(),
-                "module": record.module,
-                "filename": record.filename,
-                "funcName": record.funcName,
-                "lineno": record.lineno
-            }
-            return json.dumps(log_record)
-
-    # Set up logging to file with rotation (to avoid growing log files indefinitely)
-    log_handler = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=5)  # 5MB log size before rotating
-    log_handler.setLevel(logging.DEBUG)
+    # Rotate the log file to avoid growing it indefinitely (5MB per file)
+    log_handler = RotatingFileHandler(
+        log_file, maxBytes=5 * 1024 * 1024, backupCount=5
+    )
     log_handler.setFormatter(JsonFormatter())
-
-    # Get root logger and remove any default handlers
-    root_logger = logging.getLogger()
-    root_logger.handlers = []  # Remove other handlers (like StreamHandler)
-
-    # Add our custom file handler
-    root_logger.setLevel(logging.DEBUG)
-    root_logger.addHandler(log_handler)
+    configure_logging(log_level, [log_handler])
 
     logging.debug("Logging setup complete - all logs going to file, none to terminal.")
 
 
-# Example log functions, similar to the original ones but simplified for demonstration
-
 def log_skipped_file(db_file, file_path, reason):
     """
-    Log skipped files or errors into a database and as a structured log.
+    Log a skipped file and queue it for the skipped_files table of db_file.
+    Rows are written in batches by the shared HashStore of the database.
     """
     try:
-        # Example: In a real case, log details would be stored in a database
-        logging.info(f"Skipped file: {file_path}, Reason: {reason}")
+        skipped_file_logger.log_skipped_file(
+            file_path, reason, get_hash_store(db_file)
+        )
     except Exception as e:
         logging.error(f"Failed to log skipped file: {file_path}, Error: {e}")
 
@@ -64,7 +64,3 @@ def report_skipped_files():
         logging.info("Report: All skipped files have been processed.")
     except Exception as e:
         logging.error(f"Failed to report skipped files: {e}")
-
-
-# After modifying, this will be the main logger setup in the updated file.
-setup_logging()
@@ -3,8 +3,12 @@
 import logging
 
 
-def log_event(level, message):
-    """Log an event with the given level and message."""
+def log_event(level, message, *args):
+    """
+    Log an event with the given level and message.
+    :param args: Values merged into the message with %-formatting, only if
+    the level is enabled
+    """
 
     # Convert string level to logging level constant
     log_levels = {
@@ -21,4 +25,4 @@ def log_event(level, message):
     )  # Default to INFO if the level is unknown
 
     # Log the event with the appropriate level
-    logging.log(log_level, message)
+    logging.log(log_level, message, *args)
@@ -1,22 +1,118 @@
 #!/usr/bin/env python3
 
+import atexit
 import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
 
+# Records of one message template let through before sampling starts
+DEFAULT_SAMPLE_BURST = 100
+# Then one record in this many is kept, per template
+DEFAULT_SAMPLE_EVERY = 100
 
-def configure_logging(log_level=logging.WARNING):
+# Listener of the handlers installed by configure_logging, and its sampler
+_listener = None
+_sampler = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sample the records of frequent events, e.g. one per skipped file.
+    Records are grouped by their unformatted message template, so messages
+    must pass their values as logging arguments. The first burst records of
+    a template are kept, then one in every. Warnings and errors are never
+    sampled.
+    """
+
+    def __init__(self, burst=DEFAULT_SAMPLE_BURST, every=DEFAULT_SAMPLE_EVERY):
+        super().__init__()
+        self.burst = burst
+        self.every = max(1, every)
+        self.counts = {}  # Message template to the records seen
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        with self.lock:
+            seen = self.counts.get(record.msg, 0)
+            self.counts[record.msg] = seen + 1
+            keep = seen < self.burst or (seen - self.burst) % self.every == 0
+            if not keep:
+                self.dropped += 1
+        return keep
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+    The queue stays within the process, so records are passed as they are
+    instead of being formatted and stripped of their arguments first.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(
+    log_level=logging.WARNING,
+    handlers=None,
+    sample_burst=DEFAULT_SAMPLE_BURST,
+    sample_every=DEFAULT_SAMPLE_EVERY,
+):
     """
     Configure the logging for the application.
-    :param log_level: The logging level (default is INFO)
+    Records are put on a queue and formatted and written by a listener
+    thread, so logging does not block the scan on terminal or file output.
+    The listener is stopped, draining the queue, at exit.
+    :param log_level: The logging level (default is WARNING)
+    :param handlers: Handlers the listener writes to, a StreamHandler by default
+    :param sample_burst: Records per message template kept before sampling,
+    see SamplingFilter, or None to keep every record
+    :return: The QueueListener
     """
+    global _listener, _sampler
     try:
-        # Configure logging
-        logging.basicConfig(
-            level=log_level,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[
-                logging.StreamHandler()  # You can add more handlers here (e.g., FileHandler)
-            ],
-        )
+        if handlers is None:
+            handlers = [logging.StreamHandler()]
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        for handler in handlers:
+            if handler.formatter is None:
+                handler.setFormatter(formatter)
+
+        stop_logging()
+        log_queue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        if sample_burst is not None:
+            _sampler = SamplingFilter(sample_burst, sample_every)
+            queue_handler.addFilter(_sampler)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        root_logger = logging.getLogger()
+        root_logger.handlers = [queue_handler]
+        root_logger.setLevel(log_level)
+        _listener = listener
         logging.info("Logging has been configured successfully.")
     except Exception as e:
         print(f"Failed to configure logging: {e}")
+    return _listener
+
+
+@atexit.register
+def stop_logging():
+    """
+    Stop the listener of configure_logging once the queued records are
+    written. Its handlers are then attached to the root logger directly, so
+    records logged later, e.g. by other exit handlers, are still written.
+    """
+    global _listener, _sampler
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    logging.getLogger().handlers = list(listener.handlers)
+    listener.stop()
+    if _sampler is not None and _sampler.dropped:
+        logging.info(f"Sampled out {_sampler.dropped} repeated log records")
+    _sampler = None
@@ -3,6 +3,11 @@
 import logging
 
 
-def log_skipped_file(file_path, reason):
-    """Log skipped file and the reason."""
-    logging.info(f"Skipped: {file_path}, Reason: {reason}")
+def log_skipped_file(file_path, reason, hash_store=None):
+    """
+    Log skipped file and the reason.
+    :param hash_store: HashStore that also records it in the skipped_files table
+    """
+    logging.info("Skipped: %s, Reason: %s", file_path, reason)
+    if hash_store is not None:
+        hash_store.log_skipped_file(file_path, reason)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Functions and allocation sites listed in the text reports
+DEFAULT_TOP = 25
+# Frames kept per allocation traceback
+TRACE_FRAMES = 10
+
+
+def default_run_directory(parent="runs"):
+    """Return a new run directory path named after the current time."""
+    return os.path.join(parent, time.strftime("run-%Y%m%d-%H%M%S"))
+
+
+class StageProfiler:
+    """
+    Profiles the stages of a scan, as reported by ScanMetrics.stage.
+    With profile set, every stage gets its own cProfile profile, switched
+    as stages nest so each one only covers its exclusive time, like the
+    stage timers. With trace_alloc set, a tracemalloc snapshot is taken at
+    the end of each top-level stage and compared with the previous one.
+    Only the stages of the thread that created the profiler are followed.
+    Artifacts are written to run_directory by write():
+    profile-<stage>.pstats and .txt, and alloc-<n>-<stage>.txt.
+    """
+
+    def __init__(
+        self, run_directory, profile=False, trace_alloc=False, top=DEFAULT_TOP
+    ):
+        self.run_directory = run_directory
+        self.profile = profile
+        self.trace_alloc = trace_alloc
+        self.top = top
+        self.thread_id = threading.get_ident()
+        self.profiles = {}  # Stage name to its cProfile.Profile
+        self.allocations = []  # (stage, current, peak, top differences)
+        self.snapshot = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def owns_current_thread(self):
+        return threading.get_ident() == self.thread_id
+
+    def start(self):
+        """Start tracing allocations, if enabled."""
+        if self.trace_alloc:
+            tracemalloc.start(TRACE_FRAMES)
+            self.snapshot = self.take_snapshot()
+
+    def stop(self):
+        """Stop tracing and write the artifacts."""
+        for profile in self.profiles.values():
+            profile.disable()
+        self.write()
+        if self.trace_alloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def take_snapshot():
+        """Take a tracemalloc snapshot without tracemalloc's own allocations."""
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+
+    def stage_started(self, name, outer):
+        """Switch profiling to a stage entered from outer, or from no stage."""
+        if self.profile:
+            if outer is not None:
+                self.profiles[outer].disable()
+            self.profiles.setdefault(name, cProfile.Profile()).enable()
+        if self.trace_alloc and outer is None:
+            tracemalloc.reset_peak()
+
+    def stage_finished(self, name, outer):
+        """Switch profiling back to outer, snapshotting after top-level stages."""
+        if self.profile:
+            self.profiles[name].disable()
+            if outer is not None:
+                self.profiles[outer].enable()
+        if self.trace_alloc and outer is None:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = self.take_snapshot()
+            differences = snapshot.compare_to(self.snapshot, "lineno")[: self.top]
+            self.allocations.append((name, current, peak, differences))
+            self.snapshot = snapshot
+
+    def write(self):
+        """Write the profiles and allocation reports into the run directory."""
+        if not (self.profiles or self.allocations):
+            return
+        os.makedirs(self.run_directory, exist_ok=True)
+        for name, profile in sorted(self.profiles.items()):
+            path = os.path.join(self.run_directory, f"profile-{name}")
+            profile.dump_stats(f"{path}.pstats")
+            report = io.StringIO()
+            stats = pstats.Stats(profile, stream=report)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            with open(f"{path}.txt", "w", encoding="utf-8") as f:
+                f.write(report.getvalue())
+
+        for index, (name, current, peak, differences) in enumerate(
+            self.allocations, start=1
+        ):
+            path = os.path.join(self.run_directory, f"alloc-{index:02d}-{name}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"Stage: {name}\n")
+                f.write(f"Traced memory at the end: {current} bytes\n")
+                f.write(f"Peak traced memory during the stage: {peak} bytes\n")
+                f.write(f"\nTop {len(differences)} allocation sites by growth:\n")
+                for difference in differences:
+                    f.write(f"{difference}\n")
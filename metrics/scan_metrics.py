@@ -1,22 +1,238 @@
 #!/usr/bin/env python3
 
+import json
+import threading
 import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from output.readme_writer import write_file_atomically
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+# Prefix of the exported Prometheus metric names
+PROMETHEUS_PREFIX = "gen_readme"
+# Sentinel for ScanMetrics.timed
+_EXHAUSTED = object()
+
+
+class LatencyHistogram:
+    """Counts of observed latencies per bucket, with their sum."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative_counts(self):
+        """Return (upper_bound, observations at or below it) pairs, ending with +Inf."""
+        running = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            pairs.append((bound, running))
+        return pairs
 
 
 class ScanMetrics:
+    """
+    Statistics of one scan: wall-clock time, per-stage timers, counters and
+    latency histograms. Stage timers are exclusive per thread: time spent in
+    a nested stage, e.g. a database batch written while rendering, is only
+    counted in the nested one. Stages timed on worker threads add up on top
+    of the main thread's. Updates are thread-safe.
+    """
+
     def __init__(self):
         self.files_scanned = 0
         self.start_time = 0
         self.end_time = 0
+        self.start_counter = 0
+        self.end_counter = 0
+        self.stage_seconds = {}  # Stage name to the seconds spent in it
+        self.counters = Counter()
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # StageProfiler notified of the stages of its own thread
+        self.profiler = None
 
     def increment_files_scanned(self):
         self.files_scanned += 1
 
     def start_timer(self):
         self.start_time = time.time()
+        self.start_counter = time.perf_counter()
 
     def stop_timer(self):
         self.end_time = time.time()
+        self.end_counter = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        """Monotonic seconds between start_timer and stop_timer."""
+        return self.end_counter - self.start_counter
+
+    def add_time(self, name, seconds):
+        """Add seconds to a stage, e.g. measured without the stage context."""
+        with self.lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of the scan and add it to the named stage."""
+        stack = self.local.__dict__.setdefault("stages", [])
+        outer = stack[-1][0] if stack else None
+        profiler = self.profiler
+        if profiler is not None and not profiler.owns_current_thread():
+            profiler = None
+        now = time.perf_counter()
+        if stack:
+            # Pause the enclosing stage
+            self.add_time(outer, now - stack[-1][1])
+        if profiler is not None:
+            profiler.stage_started(name, outer)
+        stack.append([name, time.perf_counter()])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            _, started = stack.pop()
+            self.add_time(name, now - started)
+            if profiler is not None:
+                profiler.stage_finished(name, outer)
+            if stack:
+                stack[-1][1] = time.perf_counter()
+
+    def timed(self, iterable, name):
+        """Yield the items of an iterable, timing only the waits for them as a stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    def increment(self, name, amount=1):
+        """Add to a named counter, e.g. files_hashed or bytes_hashed."""
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, name, seconds):
+        """Record a latency in the named histogram."""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def throughput(self):
+        """Return (files per second, bytes hashed per second) over the scan."""
+        elapsed = self.elapsed
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (
+            self.files_scanned / elapsed,
+            self.counters["bytes_hashed"] / elapsed,
+        )
+
+    def to_dict(self):
+        """Return every metric as JSON-serializable data."""
+        files_per_second, bytes_per_second = self.throughput()
+        return {
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "elapsed_seconds": self.elapsed,
+            "files_scanned": self.files_scanned,
+            "files_per_second": files_per_second,
+            "bytes_hashed_per_second": bytes_per_second,
+            "stage_seconds": dict(sorted(self.stage_seconds.items())),
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {
+                name: {
+                    "buckets": [
+                        ["+Inf" if bound == float("inf") else bound, count]
+                        for bound, count in histogram.cumulative_counts()
+                    ],
+                    "count": histogram.count,
+                    "sum": histogram.total,
+                }
+                for name, histogram in sorted(self.histograms.items())
+            },
+        }
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        The file describes one run and is replaced by the next, so counters
+        are exported as per-run gauges named last_run_*, not as _total
+        counters that would appear to reset after every run.
+        """
+        files_per_second, bytes_per_second = self.throughput()
+        prefix = f"{prefix}_last_run"
+        lines = []
+
+        def gauge(name, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text} Per-run gauge.")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {value}")
+
+        for name, help_text, value in (
+            ("timestamp_seconds", "End time of the last run.", self.end_time),
+            ("seconds", "Duration of the last run.", self.elapsed),
+            ("files_scanned", "Files scanned by the last run.", self.files_scanned),
+            ("files_per_second", "Scan throughput of the last run.", files_per_second),
+            (
+                "bytes_hashed_per_second",
+                "Hashing throughput of the last run.",
+                bytes_per_second,
+            ),
+        ):
+            gauge(name, help_text, [("", value)])
+        gauge(
+            "stage_seconds",
+            "Seconds spent per stage in the last run.",
+            [
+                (f'{{stage="{stage}"}}', seconds)
+                for stage, seconds in sorted(self.stage_seconds.items())
+            ],
+        )
+        for name, value in sorted(self.counters.items()):
+            description = name.replace("_", " ").capitalize()
+            gauge(name, f"{description} in the last run.", [("", value)])
+
+        for name, histogram in sorted(self.histograms.items()):
+            description = name.replace("_", " ")
+            lines.append(
+                f"# HELP {prefix}_{name} Histogram of {description} in the last run."
+            )
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for bound, count in histogram.cumulative_counts():
+                label = "+Inf" if bound == float("inf") else bound
+                lines.append(f'{prefix}_{name}_bucket{{le="{label}"}} {count}')
+            lines.append(f"{prefix}_{name}_sum {histogram.total}")
+            lines.append(f"{prefix}_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, json_path=None, prometheus_path=None):
+        """
+        Write the JSON report and the Prometheus textfile, each replaced
+        atomically so a collector never reads a partial file.
+        """
+        if json_path:
+            write_file_atomically(json_path, [json.dumps(self.to_dict(), indent=2)])
+        if prometheus_path:
+            write_file_atomically(prometheus_path, [self.to_prometheus()])
 
     def display_metrics(self):
         total_time = self.end_time - self.start_time
@@ -1,57 +1,197 @@
 #!/usr/bin/env python3
 import os
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from logs.event_logger import log_event
+from .readme_writer import README_FILENAME, ReadmeWriter, WrittenPages, is_readme_path
 
+# Writes queued per worker before listing waits for one to finish
+MAX_PENDING_WRITES_PER_WORKER = 8
 
-def process_or_manage_readme_files(directory, changes):
+
+def list_directory_entries(dirpath, ignore_rules=None, written_pages=None):
+    """
+    Return the sorted visible files and subdirectories of a directory.
+    README continuation pages are left out; they are linked from README.md.
+    :param ignore_rules: IgnoreRules whose ignored entries are left out
+    :param written_pages: WrittenPages telling continuation pages apart from
+    README-N.md files of the user, see is_readme_path
+    """
+    matcher = ignore_rules.matcher(dirpath) if ignore_rules is not None else None
+    filenames = []
+    dirnames = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue  # Skip hidden files and directories
+            is_dir = entry.is_dir()
+            if matcher and matcher.ignores(entry.path, is_dir):
+                continue
+            if is_dir:
+                dirnames.append(entry.name)
+            elif entry.name == README_FILENAME or not is_readme_path(
+                entry.path, written_pages
+            ):
+                filenames.append(entry.name)
+    return sorted(filenames), sorted(dirnames)
+
+
+def group_changes_by_directory(changes, written_pages=None):
+    """
+    Index changed paths by their parent directory in one pass.
+    The READMEs themselves are left out, since every write changes them.
+    :param written_pages: WrittenPages, see is_readme_path
+    :return: Directory paths mapped to the names of their changed entries
+    """
+    changes_by_directory = defaultdict(list)
+    for file_path in changes:
+        if not is_readme_path(file_path, written_pages):
+            dirpath, name = os.path.split(file_path)
+            changes_by_directory[dirpath].append(name)
+    return changes_by_directory
+
+
+def process_or_manage_readme_files(
+    directory, changes, readme_writer=None, ignore_rules=None
+):
     """Ensure README.md files are created or updated for each directory."""
+    readme_writer = readme_writer or ReadmeWriter()
+    changes_by_directory = group_changes_by_directory(changes)
     readme_created_count = 0
     readme_updated_count = 0
 
     for dirpath, dirnames, filenames in os.walk(directory):
-        log_event("DEBUG", f"Processing directory: {dirpath}")
-        dirnames[:] = [
+        log_event("DEBUG", "Processing directory: %s", dirpath)
+        dirnames[:] = sorted(
             d for d in dirnames if not d.startswith(".")
-        ]  # Skip hidden directories
-        filenames = [f for f in filenames if not f.startswith(".")]  # Skip hidden files
-
-        readme_path = os.path.join(dirpath, "README.md")
-
-        # Check if README exists
-        if not os.path.exists(readme_path):
-            # Create README
-            with open(readme_path, "w", encoding="utf-8") as f:
-                f.write(f"# Directory Listing for {dirpath}\n\n")
-                f.write("## Files:\n")
-                for file in filenames:
-                    f.write(f"- {file}\n")
-                f.write("\n## Subdirectories:\n")
-                for subdir in dirnames:
-                    f.write(f"- {subdir}\n")
-                f.write(
-                    f"\n> There are {len(filenames)} files and {len(dirnames)} directories in {dirpath}.\n"
-                )
-                f.write(f"Last update: {changes}\n")
+        )  # Skip hidden directories
+        filenames = sorted(
+            f
+            for f in filenames
+            if not f.startswith(".")
+            and (f == README_FILENAME or not is_readme_path(os.path.join(dirpath, f)))
+        )  # Skip hidden files and README continuation pages
+        if ignore_rules is not None:
+            matcher = ignore_rules.matcher(dirpath)
+            dirnames[:] = [
+                d
+                for d in dirnames
+                if not matcher.ignores(os.path.join(dirpath, d), is_dir=True)
+            ]
+            filenames = [
+                f for f in filenames if not matcher.ignores(os.path.join(dirpath, f))
+            ]
+
+        result, _ = readme_writer.write(
+            dirpath, filenames, dirnames, changes_by_directory.get(dirpath, [])
+        )
+        if result == "created":
             readme_created_count += 1
-        else:
-            # Check if the content has actually changed before updating
-            with open(readme_path, "r", encoding="utf-8") as f:
-                existing_content = f.read()
-
-            new_content = (
-                f"# Directory Listing for {dirpath}\n\n"
-                f"## Files:\n"
-                + "".join(f"- {file}\n" for file in filenames)
-                + f"\n## Subdirectories:\n"
-                + "".join(f"- {subdir}\n" for subdir in dirnames)
-                + f"\n> There are {len(filenames)} files and {len(dirnames)} directories in {dirpath}.\n"
-                f"Last update: {changes}\n"
+        elif result == "updated":
+            readme_updated_count += 1
+
+    return readme_created_count, readme_updated_count
+
+
+def process_planned_readmes(
+    directories,
+    changes,
+    hash_store=None,
+    readme_writer=None,
+    ignore_rules=None,
+    written_pages=None,
+):
+    """
+    Render the README.md of each planned directory exactly once.
+    Subdirectories found without a README.md (new or empty directories)
+    are rendered as well, since the change list cannot contain them.
+    Each README only summarizes the changes of its own directory, so its
+    content stays the same when nothing in the directory changed.
+    With a hash_store, the digest of every written README is stored, and a
+    README whose new content matches its stored digest is skipped without
+    being read. READMEs are rendered and written by the writer's threads.
+    :param hash_store: HashStore holding the README digests, or None to
+    compare with the README on disk
+    :param readme_writer: ReadmeWriter with the page layout and thread count
+    :param ignore_rules: IgnoreRules whose ignored entries are left out, and
+    whose ignored directories get no README
+    :param written_pages: WrittenPages of the directories, see is_readme_path
+    """
+    readme_writer = readme_writer or ReadmeWriter()
+    written_pages = written_pages or WrittenPages(hash_store)
+    if ignore_rules is not None:
+        directories = [
+            dirpath
+            for dirpath in directories
+            if not ignore_rules.ignores(dirpath, is_dir=True)
+        ]
+    changes_by_directory = group_changes_by_directory(changes, written_pages)
+    readme_counts = {"created": 0, "updated": 0}
+    stored_digests = (
+        hash_store.load_readme_digests(directories) if hash_store is not None else {}
+    )
+
+    def finish_write(dirpath, pages, write):
+        # Runs on the calling thread, which owns the database connection
+        try:
+            result, digest = write()
+        except OSError as e:
+            log_event("ERROR", f"Failed to write the README of {dirpath}: {e}")
+            return
+        if result is not None:
+            readme_counts[result] += 1
+            written_pages.update(dirpath, pages)
+        if hash_store is not None and digest != stored_digests.get(dirpath):
+            hash_store.save_readme_digest(dirpath, digest, pages)
+
+    workers = readme_writer.workers
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    writes = {}
+
+    def drain(limit):
+        while len(writes) > limit:
+            done, _ = wait(writes, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish_write(*writes.pop(future), future.result)
+
+    try:
+        pending = list(directories)
+        rendered = set(pending)
+        while pending:
+            dirpath = pending.pop()
+            log_event("DEBUG", "Processing directory: %s", dirpath)
+            try:
+                filenames, dirnames = list_directory_entries(
+                    dirpath, ignore_rules, written_pages
+                )
+            except OSError as e:
+                log_event("ERROR", f"Failed to list directory {dirpath}: {e}")
+                continue
+
+            args = (
+                dirpath,
+                filenames,
+                dirnames,
+                changes_by_directory.get(dirpath, []),
+                stored_digests.get(dirpath),
             )
+            pages = readme_writer.page_count(len(filenames) + len(dirnames))
+            if executor is None:
+                finish_write(dirpath, pages, lambda: readme_writer.write(*args))
+            else:
+                writes[executor.submit(readme_writer.write, *args)] = dirpath, pages
+                drain(workers * MAX_PENDING_WRITES_PER_WORKER)
 
-            if existing_content != new_content:
-                # Only update if the content is different
-                with open(readme_path, "w", encoding="utf-8") as f:
-                    f.write(new_content)
-                readme_updated_count += 1
+            for subdir in dirnames:
+                subdir_path = os.path.join(dirpath, subdir)
+                if subdir_path in rendered:
+                    continue
+                if not os.path.exists(os.path.join(subdir_path, README_FILENAME)):
+                    rendered.add(subdir_path)
+                    pending.append(subdir_path)
+        drain(0)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-    return readme_created_count, readme_updated_count
+    return readme_counts["created"], readme_counts["updated"]
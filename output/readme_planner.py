@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import os
+from output.readme_writer import README_FILENAME, is_readme_path
+
+
+def is_within_directory(path, directory):
+    """Check whether a path is the directory itself or lies below it."""
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def collect_directories(parents, directory):
+    """Return the given file parent directories plus their ancestors up to the root."""
+    directories = set()
+    for parent in parents:
+        while parent not in directories and is_within_directory(parent, directory):
+            directories.add(parent)
+            if parent == directory:
+                break
+            parent = os.path.dirname(parent)
+    return directories
+
+
+def plan_readme_directories(
+    directory,
+    changes,
+    current_directories,
+    stored_directories,
+    changed_directories=None,
+    written_pages=None,
+):
+    """
+    Work out which directories need their README regenerated.
+    :param directory: The scanned root directory
+    :param changes: Paths reported as new, modified or deleted
+    :param current_directories: Directories holding the files found by the
+    current scan
+    :param stored_directories: Directories recorded by the previous run
+    :param changed_directories: Directories whose tree hash changed. Other
+    directories are proven unchanged and are not rendered.
+    :param written_pages: WrittenPages of the directories, see is_readme_path
+    :return: Sorted list of directories to render
+    """
+    dirty = set()
+
+    # Directories holding changed or deleted files, or missing a README page
+    for file_path in changes:
+        if not is_readme_path(file_path, written_pages) or not os.path.exists(
+            file_path
+        ):
+            dirty.add(os.path.dirname(file_path))
+
+    # Parents of added or removed subdirectories have a new subdirectory list
+    current_dirs = collect_directories(current_directories, directory)
+    stored_dirs = collect_directories(stored_directories, directory)
+    for dirpath in current_dirs ^ stored_dirs:
+        if dirpath != directory:
+            dirty.add(os.path.dirname(dirpath))
+        if dirpath in current_dirs:
+            dirty.add(dirpath)
+
+    if changed_directories is not None:
+        dirty &= changed_directories
+
+    if not os.path.exists(os.path.join(directory, README_FILENAME)):
+        dirty.add(directory)
+
+    return sorted(dirpath for dirpath in dirty if os.path.isdir(dirpath))
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+import re
+import threading
+
+README_FILENAME = "README.md"
+# README.md plus its continuation pages README-2.md, README-3.md, ...
+README_PAGE_PATTERN = re.compile(r"README(?:-([2-9]|[1-9][0-9]+))?\.md")
+# Title of the first page of a README written as several pages
+FIRST_PAGE_TITLE_PATTERN = re.compile(
+    r"# Directory Listing for .* \(page 1 of ([0-9]+)\)"
+)
+# Threads writing changed READMEs; 1 writes inline
+DEFAULT_README_WORKERS = 4
+# Entries listed per README page; 0 lists every entry on one page
+DEFAULT_MAX_ENTRIES = 10000
+# What happens to the entries past max_entries
+OVERFLOW_MODES = ("paginate", "summary")
+# Changed entries named in a README before the rest are only counted
+MAX_LISTED_CHANGES = 20
+# Bytes read per call when hashing existing pages
+READ_BLOCK_SIZE = 64 * 1024
+# Entry lines joined into one chunk before it is hashed or written
+LINES_PER_CHUNK = 1024
+
+
+def readme_page_number(name):
+    """Return the page number of a README page name, or None for other names."""
+    match = README_PAGE_PATTERN.fullmatch(name)
+    if match is None:
+        return None
+    return int(match.group(1) or 1)
+
+
+def is_readme_file(name, pages=1):
+    """
+    Check whether a file name is a README page written by this tool.
+    :param pages: Number of pages written to the file's directory; a
+    README-N.md past them is a file of the user
+    """
+    page = readme_page_number(name)
+    return page is not None and page <= pages
+
+
+def read_page_count(dirpath):
+    """
+    Return the number of README pages written to a directory, from the
+    title of its README.md, or 0 if it has none.
+    """
+    try:
+        with open(
+            os.path.join(dirpath, README_FILENAME), encoding="utf-8", errors="replace"
+        ) as f:
+            title = f.readline().rstrip("\n")
+    except FileNotFoundError:
+        return 0
+    except OSError:
+        return 1
+    match = FIRST_PAGE_TITLE_PATTERN.fullmatch(title)
+    return int(match.group(1)) if match else 1
+
+
+def is_readme_path(file_path, written_pages=None):
+    """
+    Check whether a path is a README page written by this tool.
+    :param written_pages: Function returning the number of pages written to
+    a directory, see WrittenPages; read_page_count by default. It is only
+    called for README-N.md names.
+    """
+    dirpath, name = os.path.split(file_path)
+    if readme_page_number(name) in (None, 1):
+        return name == README_FILENAME
+    return is_readme_file(name, (written_pages or read_page_count)(dirpath))
+
+
+class WrittenPages:
+    """
+    Number of README pages written to each directory, telling continuation
+    pages apart from files of the user named README-N.md. Counts are stored
+    with the README digests; directories without a stored count fall back
+    to the title of their README.md. Lookups are cached.
+    """
+
+    def __init__(self, hash_store=None):
+        self.hash_store = hash_store
+        self.counts = {}
+
+    def __call__(self, dirpath):
+        pages = self.counts.get(dirpath)
+        if pages is None:
+            if self.hash_store is not None:
+                pages = self.hash_store.load_readme_pages(dirpath)
+            if pages is None:
+                pages = read_page_count(dirpath)
+            self.counts[dirpath] = pages
+        return pages
+
+    def update(self, dirpath, pages):
+        """Record the pages just written to a directory."""
+        self.counts[dirpath] = pages
+
+
+def readme_page_name(page):
+    """Return the file name of a README page, counting from 1."""
+    return README_FILENAME if page == 1 else f"README-{page}.md"
+
+
+def summarize_changes(names):
+    """Return the change summary of one README, naming at most MAX_LISTED_CHANGES."""
+    if not names:
+        return "no changes"
+    names = sorted(set(names))
+    summary = ", ".join(names[:MAX_LISTED_CHANGES])
+    if len(names) > MAX_LISTED_CHANGES:
+        summary += f" and {len(names) - MAX_LISTED_CHANGES} more"
+    return summary
+
+
+def iter_entry_lines(names, start, stop):
+    """Yield the "- name" lines of names[start:stop] in chunks of LINES_PER_CHUNK."""
+    for chunk_start in range(start, stop, LINES_PER_CHUNK):
+        chunk_stop = min(chunk_start + LINES_PER_CHUNK, stop)
+        yield "".join(f"- {names[index]}\n" for index in range(chunk_start, chunk_stop))
+
+
+def write_file_atomically(path, chunks):
+    """
+    Write text chunks to a hidden temporary file in the same directory,
+    renamed over the target, so readers never see a partially written file.
+    """
+    dirpath, name = os.path.split(path)
+    # Unique per writer; hidden so scans and watchers skip it
+    temp_path = os.path.join(
+        dirpath, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(chunks)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ReadmeWriter:
+    """
+    Renders the README pages of directories and writes the changed ones.
+    Pages are produced line by line from the sorted entry lists and hashed
+    or written as they are produced, so memory does not depend on the size
+    of the README. A directory with more than max_entries entries is split
+    into continuation pages (README-2.md, README-3.md, ...), or in summary
+    mode lists its first max_entries entries and counts the rest.
+    """
+
+    def __init__(
+        self,
+        workers=DEFAULT_README_WORKERS,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        overflow="paginate",
+    ):
+        """
+        :param workers: Threads writing READMEs; 1 writes inline
+        :param max_entries: Entries per page, or 0 for no limit
+        :param overflow: "paginate" or "summary", see OVERFLOW_MODES
+        """
+        if overflow not in OVERFLOW_MODES:
+            raise ValueError(f"Unknown README overflow mode: {overflow}")
+        self.workers = max(1, workers)
+        self.max_entries = max_entries if max_entries and max_entries > 0 else None
+        self.overflow = overflow
+
+    def page_count(self, entry_count):
+        """Return the number of pages needed for a directory's entries."""
+        if self.max_entries is None or self.overflow != "paginate":
+            return 1
+        return max(1, -(-entry_count // self.max_entries))
+
+    def iter_page(self, dirpath, filenames, dirnames, changes, page, pages):
+        """Yield the lines of one README page."""
+        total = len(filenames) + len(dirnames)
+        start = 0
+        end = total
+        if self.max_entries is not None:
+            start = (page - 1) * self.max_entries
+            end = min(start + self.max_entries, total)
+
+        title = f"# Directory Listing for {dirpath}"
+        if pages > 1:
+            title += f" (page {page} of {pages})"
+        yield f"{title}\n\n"
+        yield "## Files:\n"
+        yield from iter_entry_lines(filenames, start, min(end, len(filenames)))
+        if self.overflow == "summary" and end < len(filenames):
+            yield f"- ... and {len(filenames) - end} more files\n"
+        yield "\n## Subdirectories:\n"
+        yield from iter_entry_lines(
+            dirnames, max(start - len(filenames), 0), end - len(filenames)
+        )
+        hidden_dirs = len(dirnames) - max(0, end - len(filenames))
+        if self.overflow == "summary" and hidden_dirs > 0:
+            yield f"- ... and {hidden_dirs} more directories\n"
+
+        yield (
+            f"\n> There are {len(filenames)} files and {len(dirnames)} "
+            f"directories in {dirpath}.\n"
+        )
+        if pages > 1:
+            links = [f"page {page} of {pages}"]
+            if page > 1:
+                previous_page = readme_page_name(page - 1)
+                links.append(f"previous [{previous_page}]({previous_page})")
+            if page < pages:
+                next_page = readme_page_name(page + 1)
+                links.append(f"next [{next_page}]({next_page})")
+            yield f"Pages: {', '.join(links)}\n"
+        yield f"Last update: {summarize_changes(changes)}\n"
+
+    def digest(self, dirpath, filenames, dirnames, changes):
+        """Return the digest of every page of a directory, as stored in the database."""
+        pages = self.page_count(len(filenames) + len(dirnames))
+        hash_obj = hashlib.blake2b(digest_size=16)
+        for page in range(1, pages + 1):
+            if pages > 1:
+                hash_obj.update(f"{readme_page_name(page)}\0".encode("utf-8"))
+            for line in self.iter_page(
+                dirpath, filenames, dirnames, changes, page, pages
+            ):
+                hash_obj.update(line.encode("utf-8"))
+        return hash_obj.digest()
+
+    def digest_existing(self, dirpath, pages):
+        """Return the digest of the pages on disk, or None if one is missing."""
+        hash_obj = hashlib.blake2b(digest_size=16)
+        try:
+            for page in range(1, pages + 1):
+                page_name = readme_page_name(page)
+                if pages > 1:
+                    hash_obj.update(f"{page_name}\0".encode("utf-8"))
+                with open(os.path.join(dirpath, page_name), "rb") as f:
+                    while block := f.read(READ_BLOCK_SIZE):
+                        hash_obj.update(block)
+        except FileNotFoundError:
+            return None
+        return hash_obj.digest()
+
+    def write(self, dirpath, filenames, dirnames, changes, stored_digest=None):
+        """
+        Create or update the README pages of one directory, unless their
+        content matches stored_digest. Without a stored digest, or when a
+        continuation page is missing, the pages on disk are read and compared
+        instead. Continuation pages left over from a longer listing, as
+        counted by the README.md being replaced, are removed; other
+        README-N.md files are left alone.
+        :param changes: Names of the changed entries of this directory
+        :return: ("created", "updated" or None when unchanged, digest)
+        """
+        pages = self.page_count(len(filenames) + len(dirnames))
+        digest = self.digest(dirpath, filenames, dirnames, changes)
+        readme_path = os.path.join(dirpath, README_FILENAME)
+        exists = os.path.exists(readme_path)
+        if exists:
+            # Trust the stored digest only while every page is still there
+            if stored_digest is None or not all(
+                os.path.exists(os.path.join(dirpath, readme_page_name(page)))
+                for page in range(2, pages + 1)
+            ):
+                stored_digest = self.digest_existing(dirpath, pages)
+            if digest == stored_digest:
+                return None, digest
+
+        written_pages = read_page_count(dirpath)
+        for page in range(1, pages + 1):
+            write_file_atomically(
+                os.path.join(dirpath, readme_page_name(page)),
+                self.iter_page(dirpath, filenames, dirnames, changes, page, pages),
+            )
+        for page in range(pages + 1, written_pages + 1):
+            try:
+                os.unlink(os.path.join(dirpath, readme_page_name(page)))
+            except FileNotFoundError:
+                pass
+        return ("updated" if exists else "created"), digest
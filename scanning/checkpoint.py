@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+from db.hash_index import DEFAULT_CACHED_DIRECTORIES
+from db.hash_store import CHANGE_DELETED, CHANGE_DIRECTORY, CHANGE_MODIFIED
+from output.readme_planner import is_within_directory
+
+# A chunk of whole directories is checkpointed once it holds this many
+# files or bytes, or as many directories as a HashIndex keeps loaded, so the
+# stored rows read for a chunk are still cached while it is hashed
+DEFAULT_CHECKPOINT_FILES = 10000
+DEFAULT_CHECKPOINT_BYTES = 2**30
+DEFAULT_CHECKPOINT_DIRECTORIES = DEFAULT_CACHED_DIRECTORIES
+
+
+class ScanCheckpoint:
+    """
+    Progress of one scan run, saved to the database at directory granularity
+    so an interrupted run can be resumed.
+    The walk is cut into chunks of whole directories. Once a chunk is hashed,
+    its changes, including the stored files gone from its directories, are
+    committed together with its file records, followed by the directories
+    whose subtree the depth-first walk has left. A resumed run does not walk
+    those finished subtrees again: their files are taken from the database
+    and the changes already recorded are reported along with the new ones.
+    """
+
+    def __init__(
+        self,
+        hash_store,
+        root,
+        max_files=DEFAULT_CHECKPOINT_FILES,
+        max_bytes=DEFAULT_CHECKPOINT_BYTES,
+        max_directories=DEFAULT_CHECKPOINT_DIRECTORIES,
+    ):
+        self.hash_store = hash_store
+        self.root = root
+        self.max_files = max(1, max_files)
+        self.max_bytes = max_bytes
+        self.max_directories = max(1, max_directories)
+        self.run_id = None  # None when the run could not be recorded
+        self.finished = set()  # Directories finished by the resumed run
+        self.recorded_changes = []  # (path, kind) recorded by the resumed run
+        # Walked directories whose subtree is not finished yet, outermost first
+        self.open_directories = []
+
+    def start(self, resume=False):
+        """Start a new run, or with resume continue the last unfinished one."""
+        if resume:
+            self.run_id = self.hash_store.find_interrupted_run(self.root)
+            if self.run_id is None:
+                logging.warning(
+                    f"No interrupted scan of {self.root} to resume, starting a new one"
+                )
+        if self.run_id is None:
+            self.run_id = self.hash_store.start_scan_run(self.root)
+            logging.info(f"Started scan run {self.run_id} of {self.root}")
+            return
+        self.finished = self.hash_store.load_run_directories(self.run_id)
+        self.recorded_changes = self.hash_store.load_run_changes(self.run_id)
+        logging.info(
+            f"Resuming scan run {self.run_id} of {self.root}: "
+            f"{len(self.finished)} directories already finished"
+        )
+
+    def changes(self, kind):
+        """Return the paths of the changes of a kind recorded by the resumed run."""
+        return [path for path, change in self.recorded_changes if change == kind]
+
+    def stored_states(self, states):
+        """Return the stored directory states without the directories the run added."""
+        added = set(self.changes(CHANGE_DIRECTORY))
+        return {path: state for path, state in states.items() if path not in added}
+
+    def finished_file_counts(self):
+        """Return the stored file count of each directory of the finished subtrees."""
+        if not self.finished:
+            return {}
+        return self.hash_store.load_run_file_counts(self.run_id)
+
+    def mark_finished_seen(self):
+        """Record the files of the finished subtrees as seen by this scan."""
+        if self.finished:
+            self.hash_store.mark_run_seen(self.run_id)
+
+    def skip_finished(self, list_func):
+        """Wrap a walker's list_func so the finished subtrees are not walked."""
+        if not self.finished:
+            return list_func
+
+        def list_unfinished(dirpath, skip_name):
+            if dirpath in self.finished:
+                return None
+            return list_func(dirpath, skip_name)
+
+        return list_unfinished
+
+    def chunks(self, batches, stored_files):
+        """
+        Group the (dirpath, files) batches of a walk into chunks of whole
+        directories.
+        :param stored_files: Function returning the stored (name, signature)
+        pairs of a directory, see HashIndex.directory_files
+        :return: Generator of (dirpaths, files, gone) with files the
+        (file_path, signature) pairs of the chunk and gone the stored files
+        missing from its directories
+        """
+        dirpaths, files, gone = [], [], []
+        size = 0
+        for dirpath, batch in batches:
+            names = {name for name, _ in batch}
+            gone.extend(
+                os.path.join(dirpath, name)
+                for name, _ in stored_files(dirpath)
+                if name not in names
+            )
+            dirpaths.append(dirpath)
+            for name, signature in batch:
+                files.append((os.path.join(dirpath, name), signature))
+                size += signature[0] if signature else 0
+            if (
+                len(files) >= self.max_files
+                or size >= self.max_bytes
+                or len(dirpaths) >= self.max_directories
+            ):
+                yield dirpaths, files, gone
+                dirpaths, files, gone = [], [], []
+                size = 0
+        if dirpaths:
+            yield dirpaths, files, gone
+
+    def save_changes(self, changes, deleted=(), added_directories=()):
+        """
+        Queue the changes of a chunk. They must be queued before its file
+        records, so no commit in between can lose them.
+        :return: The deleted files, whose rows are removed when their change
+        is written, or an empty list if the run is not recorded
+        """
+        if self.run_id is None:
+            return []
+        for kind, paths in (
+            (CHANGE_MODIFIED, changes),
+            (CHANGE_DELETED, deleted),
+            (CHANGE_DIRECTORY, added_directories),
+        ):
+            for path in paths:
+                self.hash_store.save_run_change(self.run_id, path, kind)
+        return list(deleted)
+
+    def save_directories(self, dirpaths):
+        """
+        Commit the directories whose subtree the walk left before reaching
+        the given ones, once the chunk they belong to is committed.
+        """
+        for dirpath in dirpaths:
+            while self.open_directories and not is_within_directory(
+                dirpath, self.open_directories[-1]
+            ):
+                self.save_directory(self.open_directories.pop())
+            self.open_directories.append(dirpath)
+        self.hash_store.flush()
+
+    def save_walk(self):
+        """Commit the directories still open once the walk is complete."""
+        while self.open_directories:
+            self.save_directory(self.open_directories.pop())
+        self.hash_store.flush()
+
+    def save_directory(self, dirpath):
+        if self.run_id is not None:
+            self.hash_store.save_run_directory(self.run_id, dirpath)
+
+    def finish(self):
+        """Mark the run finished and drop its recorded progress."""
+        if self.run_id is not None:
+            self.hash_store.finish_scan_run(self.run_id)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import os
+import time
+from collections import defaultdict
+from detection.change_detector import RACY_WINDOW_NS
+from hashing.algorithms import DEFAULT_ALGORITHM, new_hasher
+from .file_scanner import get_stat_signature, list_directory
+
+
+class DirectoryTree:
+    """
+    Directory stat signatures and Merkle tree hashes for one scan.
+    The tree hash of a directory covers the names and digests of its files
+    and the names and tree hashes of its subdirectories, so it changes
+    whenever anything below the directory changes.
+    With trust_signatures set, a directory whose stat signature and tree
+    hash are both stored and whose signature is unchanged is not listed
+    again: its stored files and subdirectories are reused, and its files are
+    not stat'ed. A directory signature only moves when entries are added,
+    removed or renamed, so in-place edits of files in such a directory are
+    not seen until a run without the option.
+    """
+
+    def __init__(
+        self,
+        stored_states,
+        trust_signatures=False,
+        algorithm=DEFAULT_ALGORITHM,
+        list_func=list_directory,
+        metrics=None,
+    ):
+        """
+        :param stored_states: Directory paths mapped to their stored
+        (signature, tree_hash), see HashStore.load_directory_states
+        :param metrics: ScanMetrics counting the reused listings
+        """
+        self.stored_states = stored_states
+        self.trust_signatures = trust_signatures
+        self.algorithm = algorithm
+        self.list_func = list_func
+        self.metrics = metrics
+        self.scan_start_ns = time.time_ns()
+        # Listed directories mapped to their (signature, subdirs)
+        self.listed = {}
+        # Listed directories mapped to the digest of their files, see add_files
+        self.files_hashes = {}
+        self.stored_subdirs = defaultdict(list)
+        for dirpath in sorted(stored_states):
+            parent = os.path.dirname(dirpath)
+            if parent != dirpath:
+                self.stored_subdirs[parent].append(dirpath)
+
+    def list_directory(self, dirpath, skip_name):
+        """
+        List a directory and record its signature, for the walkers' list_func.
+        Returns None as the file list of a directory trusted to be unchanged.
+        Only reads in-memory state, so it is safe in concurrent walks.
+        """
+        try:
+            signature = get_stat_signature(os.stat(dirpath))
+        except OSError:
+            signature = None
+        stored_signature, tree_hash = self.stored_states.get(dirpath, (None, None))
+        if (
+            self.trust_signatures
+            and signature is not None
+            and tree_hash is not None
+            and signature == stored_signature
+        ):
+            listing = None, self.stored_subdirs.get(dirpath, [])
+            if self.metrics is not None:
+                self.metrics.increment("directories_reused")
+        else:
+            listing = self.list_func(dirpath, skip_name)
+        if listing is not None:
+            self.listed[dirpath] = (signature, listing[1])
+        return listing
+
+    def hash_entries(self, hash_obj, entries):
+        """Hash (name, binary digest) pairs, length-prefixed and sorted by name."""
+        for name, digest in sorted(entries):
+            encoded = name.encode("utf-8", "surrogateescape")
+            hash_obj.update(len(encoded).to_bytes(4, "little") + encoded)
+            hash_obj.update(len(digest).to_bytes(1, "little") + digest)
+
+    def add_files(self, file_hashes):
+        """
+        Hash the files of whole directories, e.g. one checkpoint chunk at a
+        time, so only one digest per directory is kept until save.
+        :param file_hashes: Current hex hash of every scanned file of the
+        directories
+        """
+        files_by_directory = defaultdict(list)
+        for file_path, file_hash in file_hashes.items():
+            dirpath, name = os.path.split(file_path)
+            if dirpath in self.listed:
+                files_by_directory[dirpath].append((name, bytes.fromhex(file_hash)))
+        for dirpath, files in files_by_directory.items():
+            hash_obj = new_hasher(self.algorithm)
+            self.hash_entries(hash_obj, files)
+            self.files_hashes[dirpath] = hash_obj.digest()
+
+    def tree_hash(self, files_hash, subdirs):
+        """
+        Hash the digest of the files of a directory, see add_files, and the
+        (name, binary tree hash) pairs of its subdirectories.
+        """
+        hash_obj = new_hasher(self.algorithm)
+        hash_obj.update(files_hash)
+        self.hash_entries(hash_obj, subdirs)
+        return hash_obj.digest()
+
+    def save(self, hash_store, untrusted_files=()):
+        """
+        Compute the tree hash of every listed directory, deepest first, and
+        queue the directory states for saving.
+        A directory holding an untrusted file, or with a subdirectory whose
+        tree hash is unknown, gets no tree hash, so it is listed again on the
+        next run.
+        :param untrusted_files: Unreadable and racily clean files
+        :return: The directories whose tree hash changed or is unknown
+        """
+        untrusted_directories = {
+            os.path.dirname(file_path) for file_path in untrusted_files
+        }
+        empty_files_hash = new_hasher(self.algorithm).digest()
+
+        tree_hashes = {}
+        changed = set()
+        deepest_first = sorted(
+            self.listed, key=lambda path: path.count(os.sep), reverse=True
+        )
+        for dirpath in deepest_first:
+            signature, subdirs = self.listed[dirpath]
+            subdir_hashes = [
+                (os.path.basename(subdir), tree_hashes.get(subdir))
+                for subdir in subdirs
+            ]
+            tree_hash = None
+            if dirpath not in untrusted_directories and all(
+                digest is not None for _, digest in subdir_hashes
+            ):
+                tree_hash = self.tree_hash(
+                    self.files_hashes.pop(dirpath, empty_files_hash), subdir_hashes
+                )
+            tree_hashes[dirpath] = tree_hash
+
+            if signature is not None and (
+                signature[1] >= self.scan_start_ns - RACY_WINDOW_NS
+            ):
+                # Racily clean: the directory may change again within the same tick
+                signature = (signature[0], None) + signature[2:]
+            hash_store.save_directory(dirpath, signature, tree_hash)
+            if (
+                tree_hash is None
+                or tree_hash != self.stored_states.get(dirpath, (None, None))[1]
+            ):
+                changed.add(dirpath)
+        return changed
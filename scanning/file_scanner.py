@@ -1,39 +1,239 @@
 #!/usr/bin/env python3
 
+import heapq
+import logging
 import os
-import concurrent.futures
+import threading
 import time
 
+# Completed listings each worker of walk_directory_concurrent may keep
+# waiting for the output before it stops taking new directories
+MAX_LISTINGS_AHEAD_PER_WORKER = 64
+
+
+def get_stat_signature(stat_result):
+    """Return the (size, mtime_ns, inode, ctime_ns) signature of a stat result."""
+    return (
+        stat_result.st_size,
+        stat_result.st_mtime_ns,
+        stat_result.st_ino,
+        stat_result.st_ctime_ns,
+    )
+
 
 def get_file_metadata(file_path):
-    """Return the file path and modification time for a file."""
+    """Return the file path and stat signature for a file."""
     try:
-        mtime = os.path.getmtime(file_path)
-        return file_path, mtime
+        return file_path, get_stat_signature(os.stat(file_path))
     except OSError:
         return None
 
 
-def scan_directory_with_parallelism(directory, max_workers=None):
-    """Scan files in the directory using parallel processing."""
-    files_metadata = []
+def is_hidden(name):
+    """Skip hidden files and directories (starting with a dot)."""
+    return name.startswith(".")
+
+
+def list_directory(dirpath, skip_name=is_hidden, metrics=None):
+    """
+    List one directory with os.scandir.
+    Files are stat'ed through their DirEntry, so each entry costs at most one
+    stat call. Entries matching skip_name are left out.
+    :param metrics: ScanMetrics receiving the walk and stat times and the
+    listing latency
+    :return: (files, subdirs) with files a list of (name, signature) and
+    subdirs a list of paths, both sorted, or None if the directory cannot be read
+    """
+    if metrics is not None:
+        with metrics.stage("walk"):
+            start = time.perf_counter()
+            stat_seconds = [0.0]
+            listing = scandir_entries(dirpath, skip_name, stat_seconds)
+            elapsed = time.perf_counter() - start
+            # Stat calls are interleaved with the listing; move their time
+            metrics.add_time("walk", -stat_seconds[0])
+            metrics.add_time("stat", stat_seconds[0])
+        metrics.observe("directory_list_seconds", elapsed)
+        if listing is not None:
+            metrics.increment("directories_listed")
+            metrics.increment("files_stated", len(listing[0]))
+        return listing
+    return scandir_entries(dirpath, skip_name)
+
+
+def scandir_entries(dirpath, skip_name, stat_seconds=None):
+    """
+    List one directory for list_directory.
+    :param stat_seconds: One-item list the time spent in stat calls is added
+    to, or None to not time them
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if skip_name(entry.name):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        if stat_seconds is None:
+                            stat_result = entry.stat()
+                        else:
+                            start = time.perf_counter()
+                            stat_result = entry.stat()
+                            stat_seconds[0] += time.perf_counter() - start
+                        files.append((entry.name, get_stat_signature(stat_result)))
+                except OSError:
+                    continue  # Removed or unreadable since it was listed
+    except OSError as e:
+        logging.error(f"Error scanning directory {dirpath}: {e}")
+        return None
+    files.sort()
+    subdirs.sort()
+    return files, subdirs
+
+
+def walk_directory(directory, skip_name=is_hidden, list_func=list_directory):
+    """
+    Walk a tree depth-first in a single pass, pruning skipped entries while
+    traversing, so skipped directories are never entered.
+    :param skip_name: Predicate on an entry name
+    :param list_func: Function listing one directory, see list_directory
+    :return: Generator of (dirpath, files) batches, one per directory, with
+    files a list of (name, signature) sorted by name
+    """
+    stack = [directory]
+    while stack:
+        dirpath = stack.pop()
+        listing = list_func(dirpath, skip_name)
+        if listing is None:
+            continue
+        files, subdirs = listing
+        yield dirpath, files
+        # Visit subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+
+def walk_directory_concurrent(
+    directory,
+    skip_name=is_hidden,
+    workers=8,
+    list_func=list_directory,
+    max_ahead=None,
+):
+    """
+    Walk a tree listing up to workers directories at once, for filesystems
+    where listing latency dominates (NFS, SMB, FUSE).
+    Pending directories sit in one queue that idle workers pull from. Each
+    directory is keyed by its position in the depth-first walk, and workers
+    take the earliest pending one, so listings run just ahead of the output.
+    Batches are yielded in the same order as walk_directory. An error raised
+    by list_func is raised again when the walk reaches its directory.
+    :param max_ahead: Completed listings kept waiting for the output before
+    workers stop taking new directories, except the one the output waits
+    for. Defaults to MAX_LISTINGS_AHEAD_PER_WORKER per worker.
+    """
+    workers = max(1, workers)
+    if max_ahead is None:
+        max_ahead = workers * MAX_LISTINGS_AHEAD_PER_WORKER
+    pending = [((), directory)]
+    listings = {}  # Order to (dirpath, listing, error)
+    condition = threading.Condition()
+    stopped = False
+    waiting_for = ()  # Order of the listing the output waits for
+
+    def can_take():
+        return pending and (len(listings) < max_ahead or pending[0][0] == waiting_for)
+
+    def list_pending():
+        while True:
+            with condition:
+                while not can_take() and not stopped:
+                    condition.wait()
+                if stopped:
+                    return
+                order, dirpath = heapq.heappop(pending)
+            listing = error = None
+            try:
+                listing = list_func(dirpath, skip_name)
+            except Exception as e:
+                error = e
+            with condition:
+                listings[order] = (dirpath, listing, error)
+                if listing is not None:
+                    for index, subdir in enumerate(listing[1]):
+                        heapq.heappush(pending, (order + (index,), subdir))
+                condition.notify_all()
+
+    threads = [
+        threading.Thread(target=list_pending, daemon=True) for _ in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        stack = [()]
+        while stack:
+            order = stack.pop()
+            with condition:
+                waiting_for = order
+                condition.notify_all()
+                while order not in listings:
+                    condition.wait()
+                dirpath, listing, error = listings.pop(order)
+                condition.notify_all()
+            if error is not None:
+                raise error
+            if listing is None:
+                continue
+            files, subdirs = listing
+            yield dirpath, files
+            stack.extend(order + (index,) for index in reversed(range(len(subdirs))))
+    finally:
+        with condition:
+            stopped = True
+            condition.notify_all()
+        for thread in threads:
+            thread.join()
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for root, dirnames, files in os.walk(directory):
-            # Skip hidden directories and files
-            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
-            files = [f for f in files if not f.startswith(".")]
 
-            # Submit batches of files for parallel scanning
-            futures += [
-                executor.submit(get_file_metadata, os.path.join(root, file))
-                for file in files
-            ]
+def scan_batches(
+    directory,
+    skip_name=is_hidden,
+    workers=1,
+    list_func=list_directory,
+    unchanged_files=None,
+):
+    """
+    Yield the (dirpath, files) batch of every directory, in depth-first order.
+    :param workers: Directories listed concurrently; 1 walks sequentially
+    :param list_func: Function listing one directory, see list_directory. It
+    may return None as the file list of a directory known to be unchanged,
+    whose files are then taken from unchanged_files(dirpath).
+    """
+    if workers > 1:
+        batches = walk_directory_concurrent(directory, skip_name, workers, list_func)
+    else:
+        batches = walk_directory(directory, skip_name, list_func)
+    for dirpath, files in batches:
+        if files is None:
+            files = unchanged_files(dirpath)
+        yield dirpath, files
 
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result:
-                files_metadata.append(result)
 
-    return files_metadata
+def scan_directory(
+    directory,
+    skip_name=is_hidden,
+    workers=1,
+    list_func=list_directory,
+    unchanged_files=None,
+):
+    """
+    Yield the (file_path, signature) of every file, directory by directory.
+    Takes the same arguments as scan_batches.
+    """
+    batches = scan_batches(directory, skip_name, workers, list_func, unchanged_files)
+    for dirpath, files in batches:
+        for name, signature in files:
+            yield os.path.join(dirpath, name), signature
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+from pathspec import GitIgnoreSpec
+from output.readme_planner import is_within_directory
+
+# Files holding .gitignore-style rules for their directory and everything
+# below it. Later files take precedence, so a .readmeignore can re-include
+# what a .gitignore leaves out.
+IGNORE_FILENAMES = (".gitignore", ".readmeignore")
+
+
+class IgnoreMatcher:
+    """
+    The ignore rules in effect in one directory: the compiled rules of each
+    directory from the root down to it, each matched relative to its own
+    directory. As in git, the last matching rule of the deepest directory
+    with a match decides.
+    """
+
+    def __init__(self, layers=()):
+        self.layers = layers  # (directory prefix, GitIgnoreSpec), root first
+
+    def __bool__(self):
+        return bool(self.layers)
+
+    def extend(self, dirpath, lines):
+        """Return the matcher of a subdirectory holding the given rules."""
+        spec = GitIgnoreSpec.from_lines(lines)
+        if not spec.patterns:
+            return self
+        return IgnoreMatcher(self.layers + ((os.path.join(dirpath, ""), spec),))
+
+    def ignores(self, path, is_dir=False):
+        """Check whether a path below the directory is ignored."""
+        for prefix, spec in reversed(self.layers):
+            relative = path[len(prefix) :]
+            if is_dir:
+                relative += "/"
+            include = spec.check_file(relative).include
+            if include is not None:
+                return include
+        return False
+
+
+class IgnoreRules:
+    """
+    .gitignore-style rules of a tree, from extra patterns applying at the
+    root and from the IGNORE_FILENAMES found in its directories.
+    The rules of each directory are compiled once, on top of the matcher
+    inherited from its parent, and cached. Ignored directories are pruned
+    from the walk before they are entered, so nothing below them is listed.
+    """
+
+    def __init__(self, root, patterns=(), filenames=IGNORE_FILENAMES):
+        """
+        :param patterns: Extra rules relative to the root, e.g. from --ignore
+        :param filenames: Names of the ignore files read in every directory,
+        or an empty tuple to only apply the patterns
+        """
+        self.root = os.path.abspath(root)
+        self.filenames = tuple(filenames)
+        self.base = IgnoreMatcher().extend(self.root, patterns)
+        self.matchers = {}  # Directory paths to their IgnoreMatcher
+
+    def parent_matcher(self, dirpath):
+        """Return the matcher a directory inherits."""
+        if dirpath == self.root or not is_within_directory(dirpath, self.root):
+            return self.base
+        return self.matcher(os.path.dirname(dirpath))
+
+    def matcher(self, dirpath, present=None):
+        """
+        Return the matcher of a directory, compiling it on first use.
+        :param present: Names of the ignore files known to be in the
+        directory, e.g. seen while listing it, or None to look for them
+        """
+        matcher = self.matchers.get(dirpath)
+        if matcher is None:
+            matcher = self.parent_matcher(dirpath)
+            lines = self.read_rules(dirpath, present)
+            if lines:
+                matcher = matcher.extend(dirpath, lines)
+            self.matchers[dirpath] = matcher
+        return matcher
+
+    def read_rules(self, dirpath, present=None):
+        """Return the lines of the ignore files of a directory."""
+        lines = []
+        for filename in self.filenames:
+            if present is not None and filename not in present:
+                continue
+            rules_path = os.path.join(dirpath, filename)
+            try:
+                with open(rules_path, encoding="utf-8", errors="replace") as f:
+                    lines.extend(f.read().splitlines())
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.error(f"Error reading ignore rules {rules_path}: {e}")
+        return lines
+
+    def forget(self, dirpath):
+        """Drop the cached matchers of a subtree, e.g. after an ignore file changed."""
+        for cached in list(self.matchers):
+            if is_within_directory(cached, dirpath):
+                self.matchers.pop(cached, None)
+
+    def ignores(self, path, is_dir=False):
+        """Check whether a path below the root, or a directory above it, is ignored."""
+        while path != self.root and is_within_directory(path, self.root):
+            parent = os.path.dirname(path)
+            if self.matcher(parent).ignores(path, is_dir):
+                return True
+            path, is_dir = parent, True
+        return False
+
+    def filter(self, list_func):
+        """
+        Wrap a walker's list_func so ignored entries are left out.
+        Entries the inherited rules ignore both as a file and as a directory
+        are skipped before they are stat'ed; the others are dropped from the
+        listing once the rules of the directory itself are known. Ignore
+        files are noticed while listing, so directories without one cost no
+        extra syscall. A directory whose own rules may re-include a skipped
+        entry is listed again without skipping.
+        """
+
+        def list_unignored(dirpath, skip_name):
+            inherited = self.parent_matcher(dirpath)
+            present = []
+            skipped = []
+            ambiguous = set()  # Names ignored as a file but not as a directory
+
+            def skip_entry(name):
+                if name in self.filenames:
+                    present.append(name)
+                if skip_name(name):
+                    return True
+                if not inherited:
+                    return False
+                path = os.path.join(dirpath, name)
+                if not inherited.ignores(path):
+                    return False
+                if inherited.ignores(path, is_dir=True):
+                    skipped.append(name)
+                    return True
+                ambiguous.add(name)
+                return False
+
+            listing = list_func(dirpath, skip_entry)
+            matcher = self.matcher(dirpath, present)
+            if listing is not None and skipped and matcher is not inherited:
+                listing = list_func(dirpath, skip_name)
+            if listing is None or not matcher:
+                return listing
+            files, subdirs = listing
+            if files is not None:
+                files = [
+                    (name, signature)
+                    for name, signature in files
+                    if (matcher is inherited and name not in ambiguous)
+                    or not matcher.ignores(os.path.join(dirpath, name))
+                ]
+            subdirs = [
+                subdir for subdir in subdirs if not matcher.ignores(subdir, True)
+            ]
+            return files, subdirs
+
+        return list_unignored
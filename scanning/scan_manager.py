@@ -1,54 +1,263 @@
 #!/usr/bin/env python3
 
+import functools
 import os
+import stat
 from metrics.scan_metrics import ScanMetrics
 from detection.change_detector import detect_changes
-from db.hash_db import load_hashes_from_db
-from output.readme_manager import process_or_manage_readme_files
+from db.hash_index import HashIndex
+from db.hash_store import CHANGE_DELETED, CHANGE_MODIFIED, HashStore
+from db.schema_manager import DB_FILE
+from logs.skipped_file_logger import log_skipped_file
+from output.readme_manager import process_planned_readmes
+from output.readme_writer import WrittenPages, is_readme_path
+from output.readme_planner import plan_readme_directories
 from output.terminal_output import TerminalOutput
-from .file_scanner import scan_directory_with_parallelism
+from hashing.chunk_hash import APPEND_CHUNK_SIZE
+from hashing.hash_computer import HashEngine
+from .checkpoint import ScanCheckpoint
+from .directory_tree import DirectoryTree
+from .file_scanner import get_stat_signature, is_hidden, list_directory, scan_batches
+from .ignore_rules import IgnoreRules
 
 
-def should_skip_file(file_path):
-    """Skip files that are hidden (starting with a dot)."""
-    return os.path.basename(file_path).startswith(".")
+def should_skip_file(file_path, ignore_rules=None):
+    """Skip files that are hidden (starting with a dot) or ignored by the rules."""
+    if is_hidden(os.path.basename(file_path)):
+        return True
+    return ignore_rules is not None and ignore_rules.ignores(file_path)
 
 
-def scan_directory_and_collect_stats(directory):
-    """Scan the directory and collect statistics for reporting."""
+def load_hash_index(hash_store, hash_engine):
+    """
+    Return a HashIndex of the stored rows, with the views of the columns the
+    hash engine needs besides hashes and signatures, or None for the ones it
+    does not use.
+    :return: (hash_index, stored_algorithms, stored_quick_hashes,
+    stored_chunks), see detect_changes
+    """
+    uses_quick_hash = hash_engine.quick_hash_min_size is not None
+    uses_append_hash = hash_engine.append_hash_min_size is not None
+    hash_index = HashIndex(
+        hash_store, chunk_size=APPEND_CHUNK_SIZE if uses_append_hash else None
+    )
+    return (
+        hash_index,
+        hash_index.algorithms,
+        hash_index.quick_hashes if uses_quick_hash else None,
+        hash_index.chunks if uses_append_hash else None,
+    )
+
+
+def save_file_records(hash_store, rehashed, file_hashes):
+    """Persist the FileRecords of the files hashed on this run and flush them."""
+    for file_path, record in rehashed.items():
+        hash_store.save_file_hash(
+            file_path,
+            file_hashes[file_path],
+            record.mtime,
+            record.signature,
+            record.algorithm,
+            record.quick_hash,
+            record.verified_at,
+        )
+        if record.chunks is not None:
+            hash_store.save_file_chunks(file_path, *record.chunks, APPEND_CHUNK_SIZE)
+    hash_store.flush()
+
+
+def scan_directory_and_collect_stats(
+    directory,
+    paranoid=False,
+    hash_engine=None,
+    hash_store=None,
+    scan_workers=1,
+    trust_directory_signatures=False,
+    readme_writer=None,
+    profiler=None,
+    resume=False,
+    shard=None,
+    render_readmes=True,
+    ignore_rules=None,
+):
+    """
+    Scan the directory and collect statistics for reporting.
+    :param paranoid: Rehash every file instead of trusting unchanged stat signatures
+    :param hash_engine: HashEngine used to hash new and modified files
+    :param hash_store: HashStore to read and write hashes through. A store on
+    DB_FILE is opened and closed for the scan when omitted.
+    :param scan_workers: Directories listed concurrently; 1 walks sequentially
+    :param trust_directory_signatures: Reuse the stored listing of directories
+    whose stat signature is unchanged, see DirectoryTree
+    :param readme_writer: ReadmeWriter rendering the READMEs
+    :param profiler: StageProfiler following the stages of the scan
+    :param resume: Continue the last interrupted scan of the directory from
+    its checkpoint instead of starting over, see ScanCheckpoint
+    :param shard: Shard limiting the scan to its part of the tree
+    :param render_readmes: Plan and render the READMEs; shards leave them to
+    the merge of their databases
+    :param ignore_rules: IgnoreRules pruning the walk and the READMEs. The
+    rules of the directory's .gitignore and .readmeignore files apply when
+    omitted.
+    """
     metrics = ScanMetrics()
+    metrics.profiler = profiler
     metrics.start_timer()
+    directory = os.path.abspath(directory)
+    hash_engine = hash_engine or HashEngine()
+    owns_store = hash_store is None
+    if owns_store:
+        hash_store = HashStore(DB_FILE)
+    hash_store.metrics = metrics
+    if ignore_rules is None:
+        ignore_rules = IgnoreRules(directory)
 
     # Load file hashes from the database
-    stored_hashes = load_hashes_from_db("file_hashes.db")
+    with metrics.stage("load"):
+        checkpoint = ScanCheckpoint(hash_store, directory)
+        checkpoint.start(resume)
+        hash_index, stored_algorithms, stored_quick_hashes, stored_chunks = (
+            load_hash_index(hash_store, hash_engine)
+        )
 
-    # Detect changes in the directory
-    changes, current_file_hashes = detect_changes(
-        directory, stored_hashes, scan_directory_with_parallelism
+        # Record directory signatures while walking, reusing trusted listings
+        directory_tree = DirectoryTree(
+            checkpoint.stored_states(hash_store.load_directory_states(directory)),
+            trust_directory_signatures and not paranoid,
+            hash_engine.algorithm,
+            ignore_rules.filter(functools.partial(list_directory, metrics=metrics)),
+            metrics,
+        )
+        # Files already seen by the resumed run, counted per directory
+        hash_store.forget_seen()
+        checkpoint.mark_finished_seen()
+        finished_file_counts = checkpoint.finished_file_counts()
+        current_directories = set(finished_file_counts)
+        scanned_files = sum(finished_file_counts.values())
+    list_func = directory_tree.list_directory
+    if shard is not None:
+        list_func = shard.filter(list_func)
+    batches = scan_batches(
+        directory,
+        workers=scan_workers,
+        list_func=checkpoint.skip_finished(list_func),
+        unchanged_files=hash_index.directory_files,
     )
 
-    # Track metrics
-    total_files = len(current_file_hashes)
-    readmes_created = 0
-    readmes_updated = 0
-    skipped_files = 0
+    changes = checkpoint.changes(CHANGE_MODIFIED)
+    deleted_files = checkpoint.changes(CHANGE_DELETED)
+    unreadable_files = []
+    racy_files = []
 
-    for idx, file_path in enumerate(current_file_hashes, start=1):
-        metrics.increment_files_scanned()
+    def skip_unreadable(file_path, reason):
+        unreadable_files.append(file_path)
+        log_skipped_file(file_path, reason, hash_store)
 
-        # Skip hidden files or directories
-        if should_skip_file(file_path):
-            skipped_files += 1
-            continue
+    # Detect changes a chunk of whole directories at a time, committing each
+    # chunk as a checkpoint; walking, stat'ing and hashing are streamed
+    with metrics.stage("detect"):
+        for dirpaths, files, gone in checkpoint.chunks(
+            batches, hash_index.directory_files
+        ):
+            chunk_changes, chunk_hashes, rehashed = detect_changes(
+                directory,
+                hash_index,
+                lambda _: files,
+                stored_signatures=hash_index.signatures,
+                paranoid=paranoid,
+                hash_engine=hash_engine,
+                stored_algorithms=stored_algorithms,
+                stored_quick_hashes=stored_quick_hashes,
+                stored_chunks=stored_chunks,
+                skip_callback=skip_unreadable,
+                metrics=metrics,
+            )
+            changes.extend(chunk_changes)
+            scanned_files += len(chunk_hashes)
+            current_directories.update(map(os.path.dirname, chunk_hashes))
+            directory_tree.add_files(chunk_hashes)
+            racy_files.extend(
+                file_path
+                for file_path, record in rehashed.items()
+                if record.signature[1] is None
+            )
+
+            # Persist the hashes and signatures of the files read on this run
+            with metrics.stage("persist"):
+                added_directories = [
+                    dirpath
+                    for dirpath in dirpaths
+                    if dirpath not in directory_tree.stored_states
+                ]
+                deleted_files.extend(
+                    checkpoint.save_changes(chunk_changes, gone, added_directories)
+                )
+                save_file_records(hash_store, rehashed, chunk_hashes)
+                hash_store.mark_seen(chunk_hashes)
+                checkpoint.save_directories(dirpaths)
+
+    with metrics.stage("persist"):
+        checkpoint.save_walk()
+
+        # Prune the rows of files that are gone and report them as changes
+        pruned_files = hash_store.prune_unseen(
+            directory, unreadable_files, directory_tree.listed
+        )
+        checkpoint.save_changes((), pruned_files)
+        hash_store.flush()
+        deleted_files = list(dict.fromkeys(deleted_files + pruned_files))
+        changes = list(dict.fromkeys(changes)) + deleted_files
+
+        # Update the directory tree hashes; racily clean files are not trusted
+        changed_directories = directory_tree.save(
+            hash_store, unreadable_files + racy_files
+        )
+        if checkpoint.finished:
+            # Skipped subtrees have no tree hash to prove them unchanged
+            changed_directories = None
+
+    # Plan against the directories stored by the previous run
+    readme_directories = []
+    written_pages = WrittenPages(hash_store)
+    if render_readmes:
+        with metrics.stage("plan"):
+            readme_directories = plan_readme_directories(
+                directory,
+                changes,
+                current_directories,
+                directory_tree.stored_states,
+                changed_directories,
+                written_pages,
+            )
+
+    # Track metrics; hidden and ignored files were already skipped by the walk
+    total_files = scanned_files + len(unreadable_files)
+    skipped_files = len(unreadable_files)
+    metrics.files_scanned = total_files
+    metrics.increment("files_changed", len(changes) - len(deleted_files))
+    metrics.increment("files_deleted", len(deleted_files))
+    metrics.increment("files_skipped", skipped_files)
+    if total_files:
+        TerminalOutput.update_progress(total_files, total_files)
 
-        # Only pass directory and changes, as process_or_manage_readme_files expects two arguments
-        created, updated = process_or_manage_readme_files(directory, changes)
-        readmes_created += created
-        readmes_updated += updated
+    # Render each directory affected by the changes exactly once
+    with metrics.stage("render"):
+        readmes_created, readmes_updated = process_planned_readmes(
+            readme_directories,
+            changes,
+            hash_store,
+            readme_writer,
+            ignore_rules,
+            written_pages,
+        )
+    metrics.increment("readmes_written", readmes_created + readmes_updated)
+    checkpoint.finish()
 
-        # Update progress in the terminal every 10 files
-        if idx % 10 == 0 or idx == total_files:
-            TerminalOutput.update_progress(idx, total_files)
+    if owns_store:
+        hash_store.close()
+    else:
+        hash_store.flush()
+        hash_store.metrics = None
 
     # Stop the timer and return relevant stats
     metrics.stop_timer()
@@ -60,3 +269,89 @@ def scan_directory_and_collect_stats(directory):
         readmes_updated,
         changes,
     )
+
+
+def update_touched_files(
+    file_paths,
+    render_directories=(),
+    hash_engine=None,
+    hash_store=None,
+    readme_writer=None,
+    ignore_rules=None,
+):
+    """
+    Bring the database and READMEs up to date for a known set of touched
+    paths, e.g. reported by a filesystem watcher, without scanning.
+    Touched files are checked through the same change detection as a scan,
+    so only the ones whose signature moved are rehashed. Touched paths that
+    no longer exist are pruned. The tree hashes of the affected directories
+    are cleared so the next full scan recomputes them.
+    :param render_directories: Directories to render even without a changed
+    file, e.g. after a subdirectory was added or removed
+    :param ignore_rules: IgnoreRules leaving ignored entries out of the READMEs
+    :return: (readmes_created, readmes_updated, changes)
+    """
+    hash_engine = hash_engine or HashEngine()
+    owns_store = hash_store is None
+    if owns_store:
+        hash_store = HashStore(DB_FILE)
+
+    current_files = []
+    missing_files = []
+    for file_path in sorted(set(file_paths), key=os.path.split):
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            missing_files.append(file_path)
+            continue
+        if stat.S_ISREG(stat_result.st_mode):
+            current_files.append((file_path, get_stat_signature(stat_result)))
+
+    hash_index, stored_algorithms, stored_quick_hashes, stored_chunks = load_hash_index(
+        hash_store, hash_engine
+    )
+    changes, current_file_hashes, rehashed = detect_changes(
+        None,
+        hash_index,
+        lambda _: current_files,
+        stored_signatures=hash_index.signatures,
+        hash_engine=hash_engine,
+        stored_algorithms=stored_algorithms,
+        stored_quick_hashes=stored_quick_hashes,
+        stored_chunks=stored_chunks,
+        skip_callback=lambda file_path, reason: log_skipped_file(
+            file_path, reason, hash_store
+        ),
+    )
+    deleted_files = [
+        file_path for file_path in missing_files if file_path in hash_index
+    ]
+    hash_store.delete_files(deleted_files)
+    changes.extend(deleted_files)
+    save_file_records(hash_store, rehashed, current_file_hashes)
+
+    touched_directories = {os.path.dirname(file_path) for file_path in changes}
+    hash_store.invalidate_tree_hashes(touched_directories | set(render_directories))
+    hash_store.flush()
+
+    written_pages = WrittenPages(hash_store)
+    dirty = {
+        os.path.dirname(file_path)
+        for file_path in changes
+        if not is_readme_path(file_path, written_pages)
+    }
+    readme_directories = sorted(
+        dirpath for dirpath in dirty | set(render_directories) if os.path.isdir(dirpath)
+    )
+    readmes_created, readmes_updated = process_planned_readmes(
+        readme_directories,
+        changes,
+        hash_store,
+        readme_writer,
+        ignore_rules,
+        written_pages,
+    )
+
+    if owns_store:
+        hash_store.close()
+    return readmes_created, readmes_updated, changes
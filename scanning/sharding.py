@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import hashlib
+import os
+from output.readme_manager import process_planned_readmes
+from output.readme_planner import is_within_directory
+from output.readme_writer import README_FILENAME, WrittenPages, is_readme_path
+from .file_scanner import list_directory
+
+# How the top-level subtrees of the root are assigned to shards
+SHARD_STRATEGIES = ("hash", "size")
+
+
+def shard_spec(value):
+    """
+    Parse an i/N shard argument, with i counted from 1.
+    :return: (index, count) with index counted from 0
+    """
+    index, count = (int(part) for part in value.split("/"))
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard {index} is not between 1 and {count}")
+    return index - 1, count
+
+
+def shard_db_path(db_file, index, count):
+    """Return the default database file of a shard, next to the main database."""
+    base, extension = os.path.splitext(db_file)
+    return f"{base}.shard-{index + 1}-of-{count}{extension}"
+
+
+def hash_shard(name, count):
+    """Return the shard of a top-level directory from the hash of its name."""
+    digest = hashlib.blake2b(
+        name.encode("utf-8", "surrogateescape"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def assign_subtrees(subdirs, count, sizes=None):
+    """
+    Assign the top-level subtrees of a root to shards.
+    With sizes, the subtrees with a size estimate are spread largest first,
+    each onto the shard with the smallest total so far. Subtrees without an
+    estimate, or all of them without sizes, go by the hash of their name.
+    The result only depends on the names and the sizes, so every shard
+    computes the same assignment.
+    :param sizes: Subtree paths mapped to their estimated size in bytes
+    :return: Subtree paths mapped to their shard, counted from 0
+    """
+    assignment = {}
+    totals = [0] * count
+    for path in sorted(sizes or {}, key=lambda path: (-sizes[path], path)):
+        shard = min(range(count), key=lambda index: (totals[index], index))
+        assignment[path] = shard
+        totals[shard] += sizes[path]
+    return {
+        path: assignment.get(path, hash_shard(os.path.basename(path), count))
+        for path in subdirs
+    }
+
+
+def subtree_sizes(directory, directory_sizes):
+    """
+    Add up the stored size of each directory into its top-level subtree.
+    :param directory_sizes: Directory paths mapped to the size of their files,
+    see HashStore.load_directory_sizes
+    """
+    sizes = {}
+    prefix = os.path.join(directory, "")
+    for dirpath, size in directory_sizes.items():
+        if size and dirpath.startswith(prefix):
+            top = os.path.join(directory, dirpath[len(prefix) :].split(os.sep)[0])
+            sizes[top] = sizes.get(top, 0) + size
+    return sizes
+
+
+class Shard:
+    """
+    One of count shards of a scan. A shard owns part of the top-level
+    subtrees of the root, and the first one also the files directly in the
+    root, so the shards together cover the tree once.
+    """
+
+    def __init__(self, root, index, count, assignment):
+        """
+        :param index: Shard number, counted from 0
+        :param assignment: Top-level subtrees mapped to their shard, see
+        assign_subtrees
+        """
+        self.root = root
+        self.index = index
+        self.count = count
+        self.owned = {path for path, shard in assignment.items() if shard == index}
+
+    def scopes(self):
+        """Return the (path, recursive) scopes of the shard, see shard_scopes."""
+        scopes = [(self.root, False)] if self.index == 0 else []
+        return scopes + [(path, True) for path in sorted(self.owned)]
+
+    def filter(self, list_func):
+        """Wrap a walker's list_func so only the shard's part of the tree is walked."""
+
+        def list_owned(dirpath, skip_name):
+            if os.path.dirname(dirpath) == self.root and dirpath not in self.owned:
+                return None
+            listing = list_func(dirpath, skip_name)
+            if dirpath == self.root and listing is not None and self.index != 0:
+                listing = [], listing[1]
+            return listing
+
+        return list_owned
+
+
+def plan_shard(directory, index, count, strategy="hash", hash_store=None):
+    """
+    List the top-level subtrees of a root and assign them to shards.
+    :param strategy: "hash" to go by name, or "size" to balance the sizes
+    stored in hash_store by the previous run, see assign_subtrees
+    :return: The Shard of the given index
+    """
+    directory = os.path.abspath(directory)
+    listing = list_directory(directory)
+    subdirs = listing[1] if listing is not None else []
+    sizes = None
+    if strategy == "size" and hash_store is not None:
+        sizes = subtree_sizes(directory, hash_store.load_directory_sizes(directory))
+    return Shard(directory, index, count, assign_subtrees(subdirs, count, sizes))
+
+
+def merge_shards(
+    directory, shard_dbs, hash_store, readme_writer=None, ignore_rules=None
+):
+    """
+    Merge shard databases into the main database, then render once the
+    READMEs of the directories their changes affect.
+    :param ignore_rules: IgnoreRules leaving ignored entries out of the READMEs
+    :return: (merged, changes, readmes_created, readmes_updated) with merged
+    the number of shard databases merged
+    """
+    directory = os.path.abspath(directory)
+    merged = 0
+    changes = []
+    added_directories = set()
+    removed_directories = set()
+    for shard_db in shard_dbs:
+        differences = hash_store.merge_shard(shard_db)
+        if differences is None:
+            continue
+        merged += 1
+        shard_changes, deleted, added, removed = differences
+        changes += shard_changes + deleted
+        added_directories.update(added)
+        removed_directories.update(removed)
+
+    # Plan like plan_readme_directories: directories holding changed files,
+    # and the parents of added or removed subdirectories
+    written_pages = WrittenPages(hash_store)
+    dirty = {
+        os.path.dirname(file_path)
+        for file_path in changes
+        if not is_readme_path(file_path, written_pages)
+    }
+    dirty |= added_directories
+    dirty |= {
+        os.path.dirname(dirpath)
+        for dirpath in added_directories | removed_directories
+        if dirpath != directory
+    }
+    if not os.path.exists(os.path.join(directory, README_FILENAME)):
+        dirty.add(directory)
+    readme_directories = sorted(
+        dirpath
+        for dirpath in dirty
+        if is_within_directory(dirpath, directory) and os.path.isdir(dirpath)
+    )
+
+    # The root was only listed in part by each shard
+    hash_store.invalidate_tree_hashes([directory])
+    readmes_created, readmes_updated = process_planned_readmes(
+        readme_directories,
+        changes,
+        hash_store,
+        readme_writer,
+        ignore_rules,
+        written_pages,
+    )
+    return merged, changes, readmes_created, readmes_updated
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import sqlite3
+from benchmarks.tree_generator import MUTATED_MTIME_NS, mutate_tree
+
+README_PREFIX = "README"
+
+
+def stored_rows(db_file, root):
+    """
+    Return the sorted (directory, name, hash) rows of a database, with paths
+    relative to root. README hashes are left out, since they name the root.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute(
+            """
+            SELECT d.path, f.name, f.hash
+            FROM files AS f JOIN directories AS d USING (dir_id)"""
+        ).fetchall()
+    finally:
+        conn.close()
+    return sorted(
+        (
+            os.path.relpath(dirpath, root),
+            name,
+            None if name.startswith(README_PREFIX) else file_hash,
+        )
+        for dirpath, name, file_hash in rows
+    )
+
+
+def readme_pages(root):
+    """Return the README pages below root by relative path, with root removed."""
+    pages = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.startswith(README_PREFIX):
+                path = os.path.join(dirpath, name)
+                with open(path, encoding="utf-8") as f:
+                    pages[os.path.relpath(path, root)] = f.read().replace(root, "")
+    return pages
+
+
+def change_tree(tree, seed=0):
+    """Rewrite, add and delete files and directories of a generated tree."""
+    mutate_tree(tree, 0.02, seed)
+    os.remove(os.path.join(tree, "dir0001", "file00000.bin"))
+    shutil.rmtree(os.path.join(tree, "dir0005", "dir0001"))
+    new_dir = os.path.join(tree, "dir0000", "newdir")
+    os.makedirs(new_dir)
+    with open(os.path.join(new_dir, "new.bin"), "wb") as f:
+        f.write(b"new")
+    for path in (os.path.join(new_dir, "new.bin"), new_dir):
+        os.utime(path, ns=(MUTATED_MTIME_NS, MUTATED_MTIME_NS))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import functools
+import os
+import pytest
+from benchmarks.tree_generator import generate_tree
+from db.hash_store import HashStore
+from hashing.hash_computer import HashEngine
+from scanning import scan_manager
+from scanning.checkpoint import ScanCheckpoint
+from tests.helpers import change_tree, readme_pages, stored_rows
+
+# Small chunks, so the tree is checkpointed many times
+CHECKPOINT_DIRECTORIES = 20
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingCheckpoint(ScanCheckpoint):
+    """ScanCheckpoint interrupting the scan once a number of chunks are saved."""
+
+    def __init__(self, *args, interrupt_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interrupt_after = interrupt_after
+        self.saved_chunks = 0
+
+    def save_directories(self, dirpaths):
+        super().save_directories(dirpaths)
+        self.saved_chunks += 1
+        if self.saved_chunks == self.interrupt_after:
+            raise Interrupted
+
+
+def scan(monkeypatch, work, resume=False, interrupt_after=None):
+    """Scan the tree of a work directory into its database."""
+    monkeypatch.setattr(
+        scan_manager,
+        "ScanCheckpoint",
+        functools.partial(
+            InterruptingCheckpoint,
+            max_directories=CHECKPOINT_DIRECTORIES,
+            interrupt_after=interrupt_after,
+        ),
+    )
+    with HashStore(os.path.join(work, "file_hashes.db")) as hash_store:
+        result = scan_manager.scan_directory_and_collect_stats(
+            os.path.join(work, "tree"),
+            hash_engine=HashEngine(1),
+            hash_store=hash_store,
+            resume=resume,
+        )
+    changes = result[5]
+    return sorted(os.path.relpath(path, work) for path in changes)
+
+
+def test_resumed_scan_matches_an_uninterrupted_one(tmp_path, monkeypatch):
+    single, resumed = str(tmp_path / "single"), str(tmp_path / "resumed")
+    for work in (single, resumed):
+        generate_tree(os.path.join(work, "tree"), "rerun", scale=0.25)
+        scan(monkeypatch, work)
+        change_tree(os.path.join(work, "tree"))
+
+    expected_changes = scan(monkeypatch, single)
+    with pytest.raises(Interrupted):
+        scan(monkeypatch, resumed, interrupt_after=1)
+    with HashStore(os.path.join(resumed, "file_hashes.db")) as hash_store:
+        root = os.path.join(resumed, "tree")
+        assert hash_store.find_interrupted_run(root) is not None
+    changes = scan(monkeypatch, resumed, resume=True)
+
+    assert expected_changes
+    assert changes == expected_changes
+    assert stored_rows(os.path.join(resumed, "file_hashes.db"), resumed) == (
+        stored_rows(os.path.join(single, "file_hashes.db"), single)
+    )
+    assert readme_pages(os.path.join(resumed, "tree")) == readme_pages(
+        os.path.join(single, "tree")
+    )
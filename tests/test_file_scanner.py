@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+import time
+import zlib
+from benchmarks.tree_generator import generate_tree
+from scanning.file_scanner import list_directory, scan_batches
+
+
+def list_with_uneven_latency(dirpath, skip_name):
+    """List a directory after a delay varying by path, finishing out of order."""
+    time.sleep(zlib.crc32(dirpath.encode()) % 5 / 1000)
+    return list_directory(dirpath, skip_name)
+
+
+def test_concurrent_batches_match_the_sequential_walk(tmp_path):
+    tree = str(tmp_path / "tree")
+    generate_tree(tree, "rerun", scale=0.1)
+
+    sequential = list(scan_batches(tree, workers=1))
+    concurrent = list(scan_batches(tree, workers=4, list_func=list_with_uneven_latency))
+
+    assert len(sequential) > 1
+    assert concurrent == sequential
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+from benchmarks.tree_generator import generate_tree
+from tests.helpers import change_tree, readme_pages, stored_rows
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "generate-readme.py")
+SHARDS = 3
+
+
+def run(cwd, *args):
+    """Run the command line tool on the tree of a work directory."""
+    subprocess.run(
+        [sys.executable, SCRIPT, "-p", "tree", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def scan_sharded(cwd):
+    """Scan every shard into its own database, then merge them."""
+    for index in range(1, SHARDS + 1):
+        run(cwd, "--shard", f"{index}/{SHARDS}")
+    run(
+        cwd,
+        "merge",
+        *(
+            f"file_hashes.shard-{index}-of-{SHARDS}.db"
+            for index in range(1, SHARDS + 1)
+        ),
+    )
+
+
+def assert_same_state(single, sharded):
+    """Check that both work directories hold the same rows and READMEs."""
+    rows = stored_rows(os.path.join(single, "file_hashes.db"), single)
+    pages = readme_pages(os.path.join(single, "tree"))
+    assert rows and pages
+    assert stored_rows(os.path.join(sharded, "file_hashes.db"), sharded) == rows
+    assert readme_pages(os.path.join(sharded, "tree")) == pages
+
+
+def test_merged_shards_match_a_single_scan(tmp_path):
+    single, sharded = str(tmp_path / "single"), str(tmp_path / "sharded")
+    for work in (single, sharded):
+        generate_tree(os.path.join(work, "tree"), "rerun", scale=0.25)
+
+    run(single)
+    scan_sharded(sharded)
+    assert_same_state(single, sharded)
+
+    # A second round merges modified, added and deleted files into existing rows
+    for work in (single, sharded):
+        change_tree(os.path.join(work, "tree"))
+    run(single)
+    scan_sharded(sharded)
+    assert_same_state(single, sharded)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+from collections import namedtuple
+
+# Event masks from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+# Events that can change the content or the listing of a directory
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+# struct inotify_event without its variable-length name
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+# dirpath is the watched directory, or None for queue overflows
+InotifyEvent = namedtuple("InotifyEvent", ["dirpath", "mask", "name"])
+
+_libc = None
+
+
+def load_libc():
+    """Load the C library and declare the inotify functions."""
+    global _libc
+    if _libc is None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+class Inotify:
+    """
+    Linux inotify instance through ctypes, watching directories by path.
+    Each watch covers one directory; subdirectories need their own watch.
+    """
+
+    def __init__(self):
+        self.libc = load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        self.paths = {}  # Watch descriptor to directory path
+        self.watches = {}  # Directory path to watch descriptor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the inotify instance and drop every watch."""
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        self.paths.clear()
+        self.watches.clear()
+
+    def add_watch(self, dirpath, mask=WATCH_MASK):
+        """Watch a directory. Raises OSError, e.g. when the watch limit is reached."""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dirpath)
+        self.paths[wd] = dirpath
+        self.watches[dirpath] = wd
+        return wd
+
+    def forget(self, dirpath):
+        """Drop the watches of a directory and everything below it."""
+        prefix = os.path.join(dirpath, "")
+        below = [
+            path for path in self.watches if path == dirpath or path.startswith(prefix)
+        ]
+        for path in below:
+            wd = self.watches.pop(path)
+            self.paths.pop(wd, None)
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout=None):
+        """
+        Wait up to timeout seconds for events and return the pending ones.
+        :return: List of InotifyEvent, empty on timeout
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].split(b"\0", 1)[0])
+            offset += length
+            dirpath = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                # The watch was removed, e.g. its directory was deleted
+                if dirpath is not None and self.watches.get(dirpath) == wd:
+                    del self.watches[dirpath]
+                self.paths.pop(wd, None)
+                continue
+            if dirpath is None and not mask & IN_Q_OVERFLOW:
+                continue  # Event of a watch dropped earlier
+            events.append(InotifyEvent(dirpath, mask, name))
+        return events
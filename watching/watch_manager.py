@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import time
+from db.hash_store import HashStore
+from db.schema_manager import DB_FILE
+from logs.event_logger import log_event
+from output.readme_writer import is_readme_path
+from scanning.file_scanner import is_hidden, walk_directory
+from scanning.ignore_rules import IgnoreRules
+from scanning.scan_manager import (
+    scan_directory_and_collect_stats,
+    update_touched_files,
+)
+from .inotify import (
+    IN_CREATE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_ISDIR,
+    IN_MOVE_SELF,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    IN_Q_OVERFLOW,
+    Inotify,
+)
+
+# Quiet period after the last event before a batch is processed
+DEFAULT_DEBOUNCE = 1.0
+# Longest a batch is held back while events keep arriving
+MAX_BATCH_DELAY_FACTOR = 10
+
+
+class EventBatch:
+    """Filesystem events coalesced per directory until the debounce window closes."""
+
+    def __init__(self, ignore_rules=None):
+        self.ignore_rules = ignore_rules
+        self.touched = {}  # Directory to the names of its touched files
+        self.render = set()  # Directories whose entry list changed
+        self.rescan = set()  # Subtrees to scan, e.g. new directories
+        self.removed = set()  # Subtrees deleted or moved away
+
+    def __bool__(self):
+        return bool(self.touched or self.render or self.rescan or self.removed)
+
+    def add(self, event):
+        """Record one InotifyEvent."""
+        if event.mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return  # Reported to the parent as a delete or move as well
+        rules = self.ignore_rules
+        if rules is not None and event.name in rules.filenames:
+            # The rules of the subtree changed, so may the entries it shows
+            rules.forget(event.dirpath)
+            self.render.add(event.dirpath)
+            self.rescan.add(event.dirpath)
+            return
+        if is_hidden(event.name):
+            return
+        path = os.path.join(event.dirpath, event.name)
+        if rules is not None and rules.ignores(path, bool(event.mask & IN_ISDIR)):
+            return
+        if event.mask & IN_ISDIR:
+            self.render.add(event.dirpath)
+            if event.mask & (IN_CREATE | IN_MOVED_TO):
+                self.rescan.add(path)
+            elif event.mask & (IN_DELETE | IN_MOVED_FROM):
+                self.removed.add(path)
+            return
+        # README pages are written by renaming a temporary file over them,
+        # which is a content change and must not render the directory again
+        moved_readme = event.mask & IN_MOVED_TO and is_readme_path(path)
+        if event.mask & (IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO) and not moved_readme:
+            self.render.add(event.dirpath)
+        self.touched.setdefault(event.dirpath, set()).add(event.name)
+
+    def touched_files(self):
+        """Return the touched file paths outside the subtrees to rescan."""
+        return [
+            os.path.join(dirpath, name)
+            for dirpath, names in self.touched.items()
+            if not any(is_within(dirpath, subtree) for subtree in self.rescan)
+            for name in names
+        ]
+
+
+def is_within(path, directory):
+    """Check whether a path is the directory itself or lies below it."""
+    return path == directory or path.startswith(os.path.join(directory, ""))
+
+
+def watch_tree(inotify, directory, ignore_rules=None):
+    """Watch a directory and every visible subdirectory below it."""
+    list_func = list_subdirectories
+    if ignore_rules is not None:
+        list_func = ignore_rules.filter(list_func)
+    for dirpath, _ in walk_directory(directory, is_hidden, list_func):
+        if dirpath in inotify.watches:
+            continue
+        try:
+            inotify.add_watch(dirpath)
+        except OSError as e:
+            log_event("ERROR", f"Failed to watch {dirpath}: {e}")
+
+
+def list_subdirectories(dirpath, skip_name):
+    """list_func for walk_directory that only lists subdirectories."""
+    try:
+        with os.scandir(dirpath) as entries:
+            subdirs = sorted(
+                entry.path
+                for entry in entries
+                if not skip_name(entry.name) and entry.is_dir(follow_symlinks=False)
+            )
+    except OSError:
+        return None
+    return [], subdirs
+
+
+def collect_batch(inotify, debounce, ignore_rules=None):
+    """
+    Wait for events and coalesce them until no event arrives for debounce
+    seconds, or the batch is MAX_BATCH_DELAY_FACTOR windows old.
+    :return: (batch, overflowed)
+    """
+    batch = EventBatch(ignore_rules)
+    overflowed = False
+    deadline = None
+    while True:
+        timeout = None
+        if deadline is not None:
+            timeout = max(0.0, min(debounce, deadline - time.monotonic()))
+        events = inotify.read_events(timeout)
+        if not events and deadline is not None:
+            return batch, overflowed
+        for event in events:
+            if event.mask & IN_Q_OVERFLOW:
+                overflowed = True
+            else:
+                batch.add(event)
+        if deadline is None and (batch or overflowed):
+            deadline = time.monotonic() + debounce * MAX_BATCH_DELAY_FACTOR
+        if deadline is not None and time.monotonic() >= deadline:
+            return batch, overflowed
+
+
+def watch_directory(
+    directory,
+    hash_engine=None,
+    hash_store=None,
+    debounce=DEFAULT_DEBOUNCE,
+    scan_workers=1,
+    readme_writer=None,
+    ignore_rules=None,
+):
+    """
+    Keep the READMEs of a tree up to date as files change, until interrupted.
+    The tree is scanned once, then inotify events are coalesced per directory
+    with a debounce window. Touched files go through update_touched_files,
+    and new directories get a scan of their subtree. When the event queue
+    overflows, events may have been lost anywhere, so the whole tree is
+    scanned again. Ignored paths are neither watched nor reported, and a
+    change to an ignore file rescans the subtree it applies to.
+    :param ignore_rules: IgnoreRules of the tree, by default from its
+    .gitignore and .readmeignore files
+    """
+    directory = os.path.abspath(directory)
+    if ignore_rules is None:
+        ignore_rules = IgnoreRules(directory)
+    owns_store = hash_store is None
+    if owns_store:
+        hash_store = HashStore(DB_FILE)
+
+    def rescan(subtree):
+        log_event("INFO", f"Scanning {subtree}")
+        scan_directory_and_collect_stats(
+            subtree,
+            hash_engine=hash_engine,
+            hash_store=hash_store,
+            scan_workers=scan_workers,
+            readme_writer=readme_writer,
+            ignore_rules=ignore_rules,
+        )
+
+    try:
+        with Inotify() as inotify:
+            # Watch before the initial scan so no change slips in between
+            watch_tree(inotify, directory, ignore_rules)
+            rescan(directory)
+            print(f"Watching {directory} for changes. Press Ctrl+C to stop.")
+            while True:
+                batch, overflowed = collect_batch(inotify, debounce, ignore_rules)
+                if overflowed:
+                    log_event("WARNING", "Event queue overflowed, rescanning the tree")
+                    forget_removed_directories(inotify)
+                    ignore_rules.forget(directory)
+                    watch_tree(inotify, directory, ignore_rules)
+                    rescan(directory)
+                else:
+                    process_batch(
+                        inotify,
+                        batch,
+                        rescan,
+                        hash_engine,
+                        hash_store,
+                        readme_writer,
+                        ignore_rules,
+                    )
+    finally:
+        if owns_store:
+            hash_store.close()
+
+
+def forget_removed_directories(inotify):
+    """Drop the watches of directories that were removed or moved away."""
+    for dirpath in list(inotify.watches):
+        if not os.path.isdir(dirpath):
+            inotify.forget(dirpath)
+
+
+def process_batch(
+    inotify, batch, rescan, hash_engine, hash_store, readme_writer, ignore_rules=None
+):
+    """Apply one EventBatch to the database and the READMEs."""
+    forget_removed_directories(inotify)
+
+    # Removed subtrees take their rows with them
+    deleted_files = []
+    for subtree in sorted(batch.removed):
+        if not os.path.isdir(subtree):
+            deleted_files += hash_store.prune_unseen(subtree, ())
+
+    # New directories may have been filled before their watch existed
+    for subtree in sorted(batch.rescan):
+        if os.path.isdir(subtree):
+            watch_tree(inotify, subtree, ignore_rules)
+            rescan(subtree)
+
+    readmes_created, readmes_updated, changes = update_touched_files(
+        batch.touched_files(),
+        batch.render,
+        hash_engine=hash_engine,
+        hash_store=hash_store,
+        readme_writer=readme_writer,
+        ignore_rules=ignore_rules,
+    )
+    logging.info(
+        f"Processed {len(changes) + len(deleted_files)} changes: "
+        f"{readmes_created} READMEs created, {readmes_updated} updated"
+    )